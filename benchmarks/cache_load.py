@@ -0,0 +1,79 @@
+"""Cold (yaml) vs warm (binary snapshot) cache load time.
+
+Usage: python benchmarks/cache_load.py [projects]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+from repin import cache
+
+PROJECTS = 10000
+
+
+class Yaml(cache.Yaml):
+    def __init__(self, root):
+        super().__init__()
+        self._root = root
+
+    def prepare(self):
+        self.root = self._root
+        self.path = os.path.join(self.root, cache.CACHE_FILE_NAME)
+
+
+def synthetic(pid):
+    return {
+        'name': 'project-{}'.format(pid),
+        'path': 'group-{}/project-{}'.format(pid % 50, pid),
+        'created_at': '2018-01-01T00:00:00.000Z',
+        'last_activity_at': '2019-06-01T00:00:00.000Z',
+        'web_url': 'https://gitlab.example.com/project-{}'.format(pid),
+        'archived': not pid % 7,
+        'default_branch': 'master',
+        ':languages': {'Python': 90.5, 'Shell': 9.5},
+        ':last_update_at': datetime.datetime(2019, 6, 1),
+        ':last_upgrade_activity': '2019-06-01T00:00:00.000Z',
+        'docker_data': False,
+        'gitlab_ci_data': {'file': '.gitlab-ci.yml', 'nexus': 'mentioned'},
+        ':requirements': {
+            'file': 'requirements.txt',
+            'list': ['requests==2.{}.0'.format(pid % 20), 'PyYAML', 'toml'],
+        },
+        ':setup.py': {
+            'file': 'setup.py',
+            'name': 'project-{}'.format(pid),
+            'version': '1.0.{}'.format(pid),
+            'install_requires': ['requests', 'PyYAML', 'toml'],
+        },
+    }
+
+
+def measure(root):
+    started = time.perf_counter()
+    loaded = Yaml(root)
+    loaded.ensure()
+    return time.perf_counter() - started, loaded.total()
+
+
+def main(projects=PROJECTS):
+    with tempfile.TemporaryDirectory() as root:
+        source = Yaml(root)
+        source.ensure()
+        for pid in range(projects):
+            source.update(pid, synthetic(pid))
+        source.compact()
+        os.remove(os.path.join(root, cache.CACHE_SNAPSHOT_NAME))
+
+        cold, total = measure(root)
+        warm, _ = measure(root)
+
+    print('projects: {}'.format(total))
+    print('cold (yaml):   {:.3f}s'.format(cold))
+    print('warm (binary): {:.3f}s'.format(warm))
+    print('speedup:       {:.1f}x'.format(cold / warm))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
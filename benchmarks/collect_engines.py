@@ -0,0 +1,53 @@
+"""Collect time of sync and async engines against fake gitlab with latency.
+
+Usage: PYTHONPATH=. python benchmarks/collect_engines.py [projects] [latency]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from repin import cli
+from tests import gitlab_server
+
+PROJECTS = 200
+LATENCY = 0.05
+
+
+def run(url, engine):
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root, '.repin'))
+    with open(os.path.join(root, '.repin', 'repin.yml'), 'w') as f:
+        f.write(
+            '[global]\nprofile = fake\n\n'
+            '[fake]\nurl = {}\nprivate_token = token\napi_version = 4\n'
+            'collect_engine = {}\n'.format(url, engine))
+
+    os.chdir(root)
+    sys.argv = ['repin', 'collect', '--update', '-v']
+    start = time.time()
+    cli.main()
+    return time.time() - start
+
+
+def main():
+    projects = int(sys.argv[1]) if len(sys.argv) > 1 else PROJECTS
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else LATENCY
+
+    server = gitlab_server.Server(
+        gitlab_server.make_projects(projects), latency)
+    engine = sys.argv[3] if len(sys.argv) > 3 else None
+    if engine:
+        print('{}: {:.2f}s, {} requests'.format(
+            engine, run(server.url, engine), sum(server.requests.values())))
+        return
+
+    # engines run in separate processes, singletons keep loaded config
+    here = os.path.abspath(__file__)
+    for engine in ('sync', 'async'):
+        os.system('{} {} {} {} {}'.format(
+            sys.executable, here, projects, latency, engine))
+
+
+if __name__ == '__main__':
+    main()
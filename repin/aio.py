@@ -0,0 +1,185 @@
+import asyncio
+import fnmatch
+import threading
+import urllib.parse
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from . import apis, blobs, errors
+from .config import config
+
+# `async_limit` profile option, max requests in flight over all projects
+ASYNC_LIMIT = 100
+
+TREE_PER_PAGE = 100
+
+# failures of prefetch, collectors fetch the rest synchronously
+ERRORS = (aiohttp.ClientError, asyncio.TimeoutError) if aiohttp else ()
+
+
+class Engine:
+    """Asyncio gitlab client, running in its own event loop thread.
+
+    Collectors stay synchronous: before they run, `prefetch` issues all
+    independent requests of a project at once over shared connection pool,
+    so collectors find tree listing and files already fetched. Requests of
+    projects collected in parallel share the pool too.
+    """
+    loop = None
+    _session = None
+    _thread = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def enabled(self):
+        return config.profile_option('collect_engine', 'sync') == 'async'
+
+    def prefetch(self, project_id, ref, patterns, dirs):
+        """Languages, repository tree and matching files of project.
+
+        Returns languages and tree, path -> blob id or None for
+        directories, and listed directories. Files matching patterns,
+        returned by `patterns(languages)`, are put into blob store.
+        """
+        return self.run(self._prefetch(project_id, ref, patterns, dirs))
+
+    def run(self, coro):
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def start(self):
+        self._lock.acquire()
+        try:
+            if self.loop is not None:
+                return
+
+            if aiohttp is None:
+                raise errors.Error(
+                    'async engine requires aiohttp, install repin[async]')
+
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self.loop.run_forever, daemon=True)
+            self._thread.start()
+        finally:
+            self._lock.release()
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if self.loop is None:
+                return
+            if self._session is not None:
+                asyncio.run_coroutine_threadsafe(
+                    self._session.close(), self.loop).result()
+                self._session = None
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self.loop = self._thread = None
+        finally:
+            self._lock.release()
+
+    def _open(self):
+        if self._session is None:
+            gl = apis.get()
+            limit = int(config.profile_option('async_limit', ASYNC_LIMIT))
+            self._session = aiohttp.ClientSession(
+                headers=gl.headers,
+                timeout=aiohttp.ClientTimeout(total=gl.timeout),
+                connector=aiohttp.TCPConnector(
+                    limit=limit, ssl=None if gl.ssl_verify else False))
+            self._url = gl._url
+        return self._session
+
+    async def _get(self, path, params=None, raw=False):
+        session = self._open()
+        async with session.get(self._url + path, params=params) as response:
+            if response.status == 404:
+                return None, response.headers
+            response.raise_for_status()
+            if raw:
+                return await response.read(), response.headers
+            return await response.json(), response.headers
+
+    async def _prefetch(self, project_id, ref, patterns, dirs):
+        prefix = '/projects/{}'.format(project_id)
+
+        languages, (tree, listed) = await asyncio.gather(
+            self._languages(prefix), self._tree(prefix, ref, ''))
+
+        if tree is not None:
+            dirs = [path for path in dirs if tree.get(path, '') is None]
+            results = await asyncio.gather(*(
+                self._tree(prefix, ref, path) for path in dirs))
+            for sub_tree, sub_listed in results:
+                if sub_tree is None:
+                    tree = listed = None
+                    break
+                tree.update(sub_tree)
+                listed |= sub_listed
+
+        if tree is not None:
+            patterns = patterns(languages)
+            await asyncio.gather(*(
+                self._blob(prefix, blob_id)
+                for path, blob_id in tree.items()
+                if blob_id and any(
+                    fnmatch.fnmatch(path, pattern) for pattern in patterns)))
+
+        return languages, tree, listed
+
+    async def _languages(self, prefix):
+        try:
+            languages, _ = await self._get(prefix + '/languages')
+        except aiohttp.ClientError:
+            return None
+        return languages
+
+    async def _tree(self, prefix, ref, path):
+        """Listing of directory, or None if it failed."""
+        tree = {}
+        page = '1'
+        while page:
+            try:
+                items, headers = await self._get(
+                    prefix + '/repository/tree', {
+                        'path': path,
+                        'ref': ref,
+                        'page': page,
+                        'per_page': TREE_PER_PAGE,
+                    })
+            except aiohttp.ClientError:
+                return None, None
+
+            # empty repository or missing directory
+            if items is None:
+                break
+
+            for item in items:
+                if item['type'] == 'tree':
+                    tree[item['path']] = None
+                elif item['type'] == 'blob':
+                    tree[item['path']] = item['id']
+            page = headers.get('X-Next-Page')
+
+        return tree, {path}
+
+    async def _blob(self, prefix, blob_id):
+        if blobs.store.get(blob_id) is not None:
+            return
+        try:
+            content, _ = await self._get('{}/repository/blobs/{}/raw'.format(
+                prefix, urllib.parse.quote(blob_id)), raw=True)
+        except aiohttp.ClientError:
+            # collector downloads it again
+            return
+        if content is not None:
+            blobs.store.put(blob_id, content)
+
+
+engine = Engine()
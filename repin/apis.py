@@ -1,5 +1,6 @@
 import gitlab
 
+from . import http_cache, scheduler
 from .config import config
 
 
@@ -11,6 +12,8 @@ class Api:
         self._api = gitlab.Gitlab.from_config(config.current_profile(), [
             config.path
         ])
+        http_cache.store.mount(self._api.session)
+        scheduler.scheduler.mount(self._api.session)
 
     def get(self):
         if not self._api:
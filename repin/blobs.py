@@ -0,0 +1,115 @@
+import os
+import threading
+
+from . import config
+
+BLOBS_DIR_NAME = 'blobs'
+
+# megabytes, `blob_cache_size` profile option
+BLOBS_SIZE_LIMIT = 256
+
+
+class Store:
+    """Repository files content by git blob id, with LRU eviction.
+
+    Files are shared between projects and refs, since equal content has
+    equal blob id.
+    """
+    root = None
+    _size = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def prepare(self):
+        if self.root:
+            return
+        self.root = os.path.join(
+            config.config.profile_root(), BLOBS_DIR_NAME)
+        self.limit = int(config.config.profile_option(
+            'blob_cache_size', BLOBS_SIZE_LIMIT)) * 1024 * 1024
+
+    def get(self, blob_id):
+        if not blob_id:
+            return None
+        self.prepare()
+
+        path = self._path(blob_id)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+
+        # mtime is used as last access time for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return content
+
+    def put(self, blob_id, content):
+        if not blob_id:
+            return
+        self.prepare()
+
+        path = self._path(blob_id)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+        self._lock.acquire()
+        try:
+            self._size = self.size() + len(content)
+            if self._size > self.limit:
+                self.evict()
+        finally:
+            self._lock.release()
+
+    def size(self):
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._iter_files())
+        return self._size
+
+    def evict(self, limit=None):
+        """Remove least recently used blobs, until size is 90% of limit."""
+        if limit is None:
+            limit = self.limit * 0.9
+
+        self._lock.acquire()
+        try:
+            files = sorted(self._iter_files())
+            self._size = sum(size for _, _, size in files)
+            for _, path, size in files:
+                if self._size <= limit:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._size -= size
+        finally:
+            self._lock.release()
+
+    def _iter_files(self):
+        if not os.path.isdir(self.root):
+            return
+        for dir_path, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, path, stat.st_size
+
+    def _path(self, blob_id):
+        return os.path.join(self.root, blob_id[:2], blob_id[2:])
+
+
+store = Store()
@@ -1,5 +1,11 @@
+import bisect
+import datetime
+import hashlib
 import os
+import pickle
+import shelve
 import shutil
+import sqlite3
 import threading
 
 import toml.decoder
@@ -7,19 +13,46 @@ import yaml
 import yaml.parser
 import yaml.representer
 
-from . import config, errors, filters
+from . import config, errors, filters, query as query_, utils
 
 CACHE_FILE_NAME = '.repin-cache'
 CACHE_FILE_BACK_NAME = '.repin-cache-back'
+CACHE_SNAPSHOT_NAME = '.repin-cache.pickle'
+CACHE_JOURNAL_NAME = '.repin-cache-journal'
+CACHE_HEAVY_NAME = '.repin-cache-heavy'
+CACHE_DB_NAME = '.repin-cache.sqlite'
+
+JOURNAL_LIMIT = 8 * 1024 * 1024
+
+# parsed manifests, stored apart from project records;
+# key -> fields kept in record
+HEAVY_KEYS = {
+    ':setup.py': ('name',),
+    ':Pipfile': (),
+    'pyproject.toml': (),
+}
+HEAVY_STUB = ':heavy'
+
+# loading of damaged pickle may fail with any of them
+PICKLE_ERRORS = (
+    EOFError, pickle.UnpicklingError, ValueError, AttributeError,
+    ImportError, IndexError, TypeError)
 
 
 class Base:
     root = None
     path = None
     _data = None
+    _retagged = False
+    _counters = None
+    read_only = False
 
     def __init__(self):
         self._lock = threading.RLock()
+        # heavy payloads changed since last flush, pid -> {key: value},
+        # None value drops payload
+        self._heavy = {}
+        self._heavy_deleted = set()
 
     def prepare(self):
         self.root = config.config.profile_root()
@@ -35,28 +68,121 @@ class Base:
             self._data = self._read()
         else:
             self._data = {}
+        return self._data
 
     def filter_map(self, query, exact, exclude=None):
         self.ensure()
+        return dict(self.items(self.compile(query, exact, exclude)))
 
+    def set_read_only(self):
+        """Keep changes in memory, `flush` and `close` store nothing."""
+        self.read_only = True
+
+    def compile(self, query, exact, exclude=None):
+        """Predicate of projects found by query and not found by exclude."""
         if query == exclude:
             exclude = ':none'
+        return query_.compile(query, exact, exclude, tags=self.tags)
+
+    def counts(self, query=':all', exclude=None):
+        """Number of projects per filter tag among found by query.
+
+        Tag queries are answered from counters, kept in step with
+        `update`/`delete`; others count found projects in a single pass.
+        """
+        self.ensure()
+
+        predicate = self.compile(query, False, exclude)
+        if not predicate.bitmap_only:
+            counters = TagCounters()
+            for pid, cached in self.items(predicate):
+                counters.add(self.tags(cached), cached)
+            return counters.count()
+
+        self._lock.acquire()
+        try:
+            if self._counters is None:
+                self._counters = TagCounters()
+                for pid, cached in self.items():
+                    self._counters.add(self.tags(cached), cached)
+            return self._counters.count(predicate.on_bitmap)
+        finally:
+            self._lock.release()
+
+    def _count_remove(self, cached):
+        if self._counters is not None and cached:
+            self._counters.remove(self.tags(cached), cached)
+
+    def _count_add(self, cached):
+        if self._counters is not None:
+            self._counters.add(self.tags(cached), cached)
 
-        filter_finally = filter_ = _parse_query(query, exact, all, any)
-        if not filter_:
-            return {}
+    def tags(self, cached):
+        """Bitmap of `filters.TAGS` matching project, see `filters.TAGS_BITS`.
+        """
+        stored = cached.get(':tags')
+        if stored and stored[0] == filters.TAGS_VERSION:
+            return stored[1]
 
-        if exclude:
-            exclude = _parse_query(exclude, False, any, all)
-            if not exclude:
-                return {}
-            filter_finally = lambda c: filter_(c) and not exclude(c)
+        # missing or built by other filters version, store on close
+        self._retagged = True
+        return self._retag(cached)
 
-        return dict(cache.items(filter_finally))
+    def _retag(self, cached):
+        bitmap = filters.tags_bitmap(cached)
+        cached[':tags'] = [filters.TAGS_VERSION, bitmap]
+        return bitmap
+
+    def heavy(self, pid):
+        """Heavy payloads of project, see `HEAVY_KEYS`."""
+        self.ensure()
+
+        self._lock.acquire()
+        try:
+            heavy = {}
+            if pid not in self._heavy_deleted:
+                heavy.update(self._read_heavy(pid) or {})
+            return _merge_heavy(heavy, self._heavy.get(pid, {}))
+        finally:
+            self._lock.release()
+
+    def full(self, pid, cached=None):
+        """Project record with heavy payloads loaded."""
+        if cached is None:
+            cached = self.select(pid, {})
+        # payload replaces its stub only, current values of record win
+        return {**cached, **{
+            key: value for key, value in self.heavy(pid).items()
+            if _is_stub(cached.get(key))}}
+
+    def _drop_replaced(self, pid, cached, data):
+        """Forget heavy payloads, replaced in `data` by other values."""
+        for key in HEAVY_KEYS:
+            if key in data and _is_stub(cached.get(key)) and not isinstance(
+                    data[key], dict):
+                self._heavy.setdefault(pid, {})[key] = None
+
+    def _split(self, pid, cached):
+        # move heavy payloads to side store, leaving small stub in record
+        for key, summary in HEAVY_KEYS.items():
+            value = cached.get(key)
+            if isinstance(value, dict) and HEAVY_STUB not in value:
+                self._heavy.setdefault(pid, {})[key] = value
+                stub = {k: value[k] for k in summary if k in value}
+                stub[HEAVY_STUB] = True
+                cached[key] = stub
+        return cached
+
+    def _drop_heavy(self, pid):
+        self._heavy.pop(pid, None)
+        self._heavy_deleted.add(pid)
 
     def _read(self):
         raise NotImplementedError
 
+    def _read_heavy(self, pid):
+        raise NotImplementedError
+
     def setdefault(self, pid, value):
         raise NotImplementedError
 
@@ -78,25 +204,96 @@ class Base:
     def flush(self):
         raise NotImplementedError
 
+    def close(self):
+        pass
+
     def clear(self):
         raise NotImplementedError
 
 
 class Yaml(Base):
+    """Yaml snapshot with append-only journal of changed projects.
+
+    Flush appends full records of projects changed since last flush to the
+    journal; the snapshot is rewritten only on `close` or when the journal
+    grows over `cache_journal_limit` bytes.
+    """
     root = None
     path = None
     _data = None
+    _shelf = None
+
+    def __init__(self):
+        super().__init__()
+        self._dirty = set()
 
     def _read(self):
+        data = self._read_snapshot()
+        if os.path.exists(self._journal_path):
+            self._replay(data)
+        return data
+
+    def _read_snapshot(self):
+        signature = self._signature()
+        data = self._read_binary(signature)
+        if data is not None:
+            return data
+
         try:
             with open(self.path, 'r') as f:
-                return yaml.load(f)
+                data = yaml.load(f, Loader=yaml.Loader)
         except yaml.parser.ParserError:
             if os.path.exists(self._backup_path):
                 shutil.move(self._backup_path, self.path)
-                return self._read()
+                return self._read_snapshot()
             raise
 
+        self._write_binary(signature, data)
+        return data
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        with open(self.path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        return stat.st_mtime_ns, stat.st_size, digest
+
+    def _read_binary(self, signature):
+        # binary copy of yaml snapshot, valid while yaml file unchanged
+        if not os.path.exists(self._binary_path):
+            return None
+        try:
+            with open(self._binary_path, 'rb') as f:
+                if pickle.load(f) != signature:
+                    return None
+                return pickle.load(f)
+        except PICKLE_ERRORS:
+            return None
+
+    def _write_binary(self, signature, data):
+        path = self._binary_path + '.tmp'
+        try:
+            with open(path, 'wb') as f:
+                pickle.dump(signature, f)
+                pickle.dump(utils.plain(data), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(path, self._binary_path)
+        except (OSError, pickle.PicklingError):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def ensure(self):
+        if self._data is not None:
+            return self._data
+
+        self.prepare()
+
+        if os.path.exists(self.path):
+            self._data = self._read()
+        else:
+            self._data = {}
+            if os.path.exists(self._journal_path):
+                self._replay(self._data)
+        return self._data
+
     def select(self, pid, default=None):
         self.ensure()
         return self._data.get(pid, default)
@@ -106,8 +303,15 @@ class Yaml(Base):
 
         self._lock.acquire()
         try:
-            self._data.setdefault(pid, {}).update(data)
-            return self._data[pid]
+            cached = self._data.setdefault(pid, {})
+            self._count_remove(cached)
+            self._drop_replaced(pid, cached, data)
+            cached.update(data)
+            self._split(pid, cached)
+            self._retag(cached)
+            self._count_add(cached)
+            self._dirty.add(pid)
+            return cached
         finally:
             self._lock.release()
 
@@ -116,7 +320,9 @@ class Yaml(Base):
 
         self._lock.acquire()
         try:
-            del self._data[pid]
+            self._count_remove(self._data.pop(pid))
+            self._drop_heavy(pid)
+            self._dirty.add(pid)
         finally:
             self._lock.release()
 
@@ -139,6 +345,35 @@ class Yaml(Base):
     def flush(self):
         self.ensure()
 
+        if self.read_only:
+            return
+        if not os.path.exists(self.path):
+            return self.compact()
+
+        limit = int(config.config.profile_option(
+            'cache_journal_limit', JOURNAL_LIMIT))
+        if os.path.exists(self._journal_path) and os.path.getsize(
+                self._journal_path) > limit:
+            return self.compact()
+
+        self._lock.acquire()
+        try:
+            self._flush_heavy()
+            if not self._dirty:
+                return
+
+            with open(self._journal_path, 'ab') as f:
+                for pid in self._dirty:
+                    pickle.dump((pid, utils.plain(self._data.get(pid))), f)
+                f.flush()
+                os.fsync(f.fileno())
+            self._dirty.clear()
+        finally:
+            self._lock.release()
+
+    def compact(self):
+        self.ensure()
+
         if not os.path.exists(self.root):
             os.makedirs(self.root)
 
@@ -151,44 +386,419 @@ class Yaml(Base):
 
         self._lock.acquire()
         try:
+            for pid, cached in self._data.items():
+                self._split(pid, cached)
+            self._flush_heavy()
+
             with open(self.path, 'w') as f:
                 yaml.dump(self._data, f)
+            self._write_binary(self._signature(), self._data)
+            if os.path.exists(self._journal_path):
+                os.remove(self._journal_path)
+            self._dirty.clear()
         except yaml.representer.RepresenterError:
             shutil.copy(self._backup_path, self.path)
             raise
         finally:
             self._lock.release()
 
+    def close(self):
+        if self._data is None:
+            return
+        if not self.read_only and (
+                self._retagged or os.path.exists(self._journal_path)):
+            self.compact()
+        if self._shelf is not None:
+            self._shelf.close()
+            self._shelf = None
+
     def clear(self):
         self._data = {}
+        self._counters = None
+        self._heavy.clear()
+        self._heavy_deleted.clear()
         if not self.path:
             self.prepare()
-        self.flush()
+        self.compact()
+        self._heavy_db(flag='n')
+
+    def _heavy_db(self, flag='c'):
+        if self._shelf is None or flag == 'n':
+            if self._shelf is not None:
+                self._shelf.close()
+            if not os.path.exists(self.root):
+                os.makedirs(self.root)
+            self._shelf = shelve.open(self._heavy_path, flag=flag)
+        return self._shelf
+
+    def _read_heavy(self, pid):
+        return self._heavy_db().get(str(pid))
+
+    def _flush_heavy(self):
+        if not self._heavy and not self._heavy_deleted:
+            return
+
+        shelf = self._heavy_db()
+        for pid in self._heavy_deleted:
+            shelf.pop(str(pid), None)
+        for pid, heavy in self._heavy.items():
+            shelf[str(pid)] = _merge_heavy(
+                shelf.get(str(pid), {}), utils.plain(heavy))
+        shelf.sync()
+        self._heavy.clear()
+        self._heavy_deleted.clear()
+
+    def _replay(self, data):
+        with open(self._journal_path, 'rb') as f:
+            while True:
+                try:
+                    pid, cached = pickle.load(f)
+                except PICKLE_ERRORS:
+                    # end of journal or record truncated by crash
+                    break
+                if cached is None:
+                    data.pop(pid, None)
+                else:
+                    data[pid] = cached
 
     @property
     def _backup_path(self):
         return os.path.join(self.root, CACHE_FILE_BACK_NAME)
 
+    @property
+    def _journal_path(self):
+        return os.path.join(self.root, CACHE_JOURNAL_NAME)
+
+    @property
+    def _binary_path(self):
+        return os.path.join(self.root, CACHE_SNAPSHOT_NAME)
+
+    @property
+    def _heavy_path(self):
+        return os.path.join(self.root, CACHE_HEAVY_NAME)
+
+
+class Sqlite(Base):
+    """One row per project, indexed by the columns queries touch most."""
+
+    _db = None
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS projects (
+            pid INTEGER PRIMARY KEY,
+            name TEXT,
+            path TEXT,
+            archived INTEGER,
+            last_activity_at TEXT,
+            data BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS projects_name ON projects (name);
+        CREATE INDEX IF NOT EXISTS projects_path ON projects (path);
+        CREATE INDEX IF NOT EXISTS projects_archived ON projects (archived);
+        CREATE INDEX IF NOT EXISTS projects_last_activity_at
+            ON projects (last_activity_at);
+        CREATE TABLE IF NOT EXISTS heavy (
+            pid INTEGER PRIMARY KEY,
+            data BLOB NOT NULL
+        );
+    '''
+
+    def prepare(self):
+        super().prepare()
+        self.path = os.path.join(self.root, CACHE_DB_NAME)
+
+    def ensure(self):
+        if self._db is not None:
+            return self._data
+
+        self.prepare()
+
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript(self.SCHEMA)
+
+        # loaded rows by pid, handed out by reference like `Yaml` does,
+        # and their pickled state as stored; flush writes updated rows
+        # only, all loaded ones after retagging
+        self._data = {}
+        self._stored = {}
+        self._deleted = set()
+        self._dirty = set()
+        return self._data
+
+    def filter_map(self, query, exact, exclude=None):
+        self.ensure()
+
+        predicate = self.compile(query, exact, exclude)
+        condition = predicate.sql()
+        if condition is None:
+            return dict(self.items(predicate))
+
+        # indexed columns preselect rows, predicate checks them after
+        return {
+            pid: cached
+            for pid, cached in self._iter_rows(*condition)
+            if predicate(cached)
+        }
+
+    def select(self, pid, default=None):
+        self.ensure()
+
+        if pid in self._data:
+            return self._data[pid]
+        if pid in self._deleted:
+            return default
+
+        row = self._db.execute(
+            'SELECT data FROM projects WHERE pid = ?', (pid,)).fetchone()
+        if row is None:
+            return default
+        return self._load(pid, row[0])
+
+    def update(self, pid, data):
+        self.ensure()
+
+        self._lock.acquire()
+        try:
+            cached = self.select(pid)
+            if cached is None:
+                cached = self._data[pid] = {}
+                self._stored[pid] = None
+                self._deleted.discard(pid)
+            self._count_remove(cached)
+            self._drop_replaced(pid, cached, data)
+            cached.update(utils.plain(data))
+            self._split(pid, cached)
+            self._retag(cached)
+            self._count_add(cached)
+            self._dirty.add(pid)
+            return cached
+        finally:
+            self._lock.release()
+
+    def delete(self, pid):
+        self.ensure()
+
+        self._lock.acquire()
+        try:
+            if self.select(pid) is None:
+                raise KeyError(pid)
+            self._count_remove(self._data.pop(pid))
+            self._drop_heavy(pid)
+            self._dirty.discard(pid)
+            if self._stored.pop(pid) is not None:
+                self._deleted.add(pid)
+        finally:
+            self._lock.release()
+
+    def total(self):
+        self.ensure()
+        stored, = self._db.execute('SELECT COUNT(*) FROM projects').fetchone()
+        new = sum(1 for dump in self._stored.values() if dump is None)
+        return stored + new - len(self._deleted)
+
+    def items(self, filter_=None, limit=None):
+        self.ensure()
+
+        index = 0
+        for pid, data in self._iter_rows():
+            if filter_ is not None and not filter_(data):
+                continue
+            if limit is not None and index > limit:
+                break
+            yield pid, data
+            index += 1
+
+    def flush(self):
+        self.ensure()
+
+        if self.read_only:
+            return
+
+        self._lock.acquire()
+        try:
+            with self._db:
+                self._db.executemany(
+                    'DELETE FROM projects WHERE pid = ?',
+                    [(pid,) for pid in self._deleted])
+                self._deleted.clear()
+
+                self._db.executemany(
+                    'DELETE FROM heavy WHERE pid = ?',
+                    [(pid,) for pid in self._heavy_deleted])
+                self._heavy_deleted.clear()
+
+                pids = list(self._data) if self._retagged else list(
+                    self._dirty)
+                for pid in pids:
+                    self._split(pid, self._data[pid])
+                for pid, heavy in self._heavy.items():
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO heavy (pid, data)'
+                        ' VALUES (?, ?)',
+                        (pid, pickle.dumps(_merge_heavy(
+                            self._read_heavy(pid), utils.plain(heavy)))))
+                self._heavy.clear()
+
+                for pid in pids:
+                    cached = self._data[pid]
+                    dump = pickle.dumps(utils.plain(cached))
+                    if dump == self._stored[pid]:
+                        continue
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO projects'
+                        ' (pid, name, path, archived, last_activity_at, data)'
+                        ' VALUES (?, ?, ?, ?, ?, ?)',
+                        (
+                            pid,
+                            cached.get('name'),
+                            cached.get('path'),
+                            cached.get('archived'),
+                            cached.get('last_activity_at'),
+                            dump,
+                        ))
+                    self._stored[pid] = dump
+                self._dirty.clear()
+                self._retagged = False
+        finally:
+            self._lock.release()
+
+    def close(self):
+        if self._db is not None:
+            if self._retagged:
+                self.flush()
+            self._db.close()
+            self._db = None
+
+    def clear(self):
+        self.ensure()
+
+        self._lock.acquire()
+        try:
+            with self._db:
+                self._db.execute('DELETE FROM projects')
+                self._db.execute('DELETE FROM heavy')
+            self._heavy.clear()
+            self._heavy_deleted.clear()
+            self._data.clear()
+            self._stored.clear()
+            self._deleted.clear()
+            self._dirty.clear()
+            self._counters = None
+        finally:
+            self._lock.release()
+
+    def _read_heavy(self, pid):
+        row = self._db.execute(
+            'SELECT data FROM heavy WHERE pid = ?', (pid,)).fetchone()
+        return pickle.loads(row[0]) if row else {}
+
+    def _load(self, pid, dump):
+        self._data[pid] = data = pickle.loads(dump)
+        self._stored[pid] = dump
+        return data
+
+    def _iter_rows(self, where=None, args=()):
+        sql = 'SELECT pid, data FROM projects'
+        if where:
+            sql += ' WHERE ' + where
+        for pid, dump in self._db.execute(sql + ' ORDER BY pid', args):
+            if pid in self._deleted or where and pid in self._dirty:
+                continue
+            if pid in self._data:
+                yield pid, self._data[pid]
+            else:
+                yield pid, self._load(pid, dump)
+
+        # stored columns of rows, changed since flush, are stale:
+        # caller's predicate checks them all
+        pending = {pid for pid, dump in self._stored.items() if dump is None}
+        if where:
+            pending |= self._dirty
+        for pid in sorted(pending):
+            yield pid, self._data[pid]
+
+
+class TagCounters:
+    """Histogram of tag bitmaps with last activity dates of projects."""
+
+    def __init__(self):
+        self._bitmaps = {}
+
+    def add(self, bitmap, cached):
+        bisect.insort(self._bitmaps.setdefault(bitmap, []), _activity(cached))
+
+    def remove(self, bitmap, cached):
+        dates = self._bitmaps.get(bitmap, [])
+        index = bisect.bisect_left(dates, _activity(cached))
+        if index < len(dates) and dates[index] == _activity(cached):
+            del dates[index]
+            if not dates:
+                del self._bitmaps[bitmap]
+
+    def count(self, include=None):
+        today = datetime.date.today()
+        cutoffs = {
+            tag: (today - datetime.timedelta(days=days + 1)).isoformat()
+            for tag, days in filters.VOLATILE_TAGS.items()
+        }
+
+        counts = dict.fromkeys(filters.FILTERS, 0)
+        for bitmap, dates in self._bitmaps.items():
+            if include is not None and not include(bitmap):
+                continue
+            for tag, bit in filters.TAGS_BITS.items():
+                if bitmap & bit:
+                    counts[tag] += len(dates)
+            for tag, cutoff in cutoffs.items():
+                # dates are sorted, older than cutoff are inactive
+                counts[tag] += bisect.bisect_right(dates, cutoff)
+        return counts
+
+
+class Proxy:
+    """Cache engine selected by `cache_engine` option of current profile."""
+
+    _engine = None
+
+    def engine(self):
+        if self._engine is None:
+            name = config.config.profile_option('cache_engine', 'yaml')
+            if name not in ENGINES:
+                raise errors.Error('Unknown cache engine: {}'.format(name))
+            self._engine = ENGINES[name]()
+        return self._engine
+
+    def __getattr__(self, name):
+        return getattr(self.engine(), name)
+
+    def close(self):
+        if self._engine is not None:
+            self._engine.close()
+
+
+ENGINES = {
+    'yaml': Yaml,
+    'sqlite': Sqlite,
+}
+
+
+def _is_stub(value):
+    return isinstance(value, dict) and HEAVY_STUB in value
 
-def _parse_query(query, exact=False, mode=all, mode_inverse=any):
-    # TODO: replace inverse symbol from '.'
-    # if '.' in query and ',' not in query:
-    #     mode = mode_inverse
-    #     query = query.replace('.', ',')
 
-    key = 'path' if '/' in query else 'name'
-    if ':' in query:
-        query = query.split(',')
-        filters_ = [filters.FILTERS.get(sub) for sub in query]
-        if not all(filters_):
-            raise errors.Error('Unknown filter: {}'.format(', '.join(
-                sub for sub in query if sub not in filters.FILTERS)))
-        return lambda cached: mode(sub(cached) for sub in filters_)
+def _merge_heavy(stored, changed):
+    """Stored payloads with changed ones; None drops payload of key."""
+    merged = {**stored, **changed}
+    return {key: value for key, value in merged.items() if value is not None}
 
-    elif exact:
-        return lambda c: query == c.get(key)
 
-    return lambda c: query in c.get(key, '')
+def _activity(cached):
+    # projects without activity date are never old, see
+    # `filters.inactive_days`
+    return (cached.get('last_activity_at') or '9999-12-31')[:10]
 
 
-cache = Yaml()
+cache = Proxy()
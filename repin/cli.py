@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 import argparse
 
-from . import commands, errors, log
+from . import aio, commands, errors, http_cache, log, parse_pool
+from .cache import cache
+from .parse_cache import parse_cache
 
 
 def main():
@@ -12,17 +14,18 @@ def main():
         commands.config.init,
         commands.info.info,
         commands.config.profile,
-        commands.config.profile,
         commands.cache.total,
         commands.collect.collect,
         commands.cache.clear,
         commands.cache.details,
+        commands.cache.cache_,
         commands.python.requirements,
         commands.python.reverse,
         commands.update.repair,
         commands.update.update,
         commands.cache.list_,
         commands.repo.cat,
+        commands.mirror.mirror,
     )
     for cmd in cmd:
         cmd.init_parser(subparsers)
@@ -39,6 +42,12 @@ def main():
             return log.catch(exc)
         except Exception:  # noqa
             return log.exception('Unhandled exception')
+        finally:
+            cache.close()
+            parse_cache.close()
+            aio.engine.close()
+            http_cache.store.close()
+            parse_pool.pool.close()
 
     parser.print_help()
 
@@ -1,18 +1,75 @@
 import importlib
 import base64
+import collections
+import datetime
+import fnmatch
 import logging
 import re
 import functools
+import hashlib
 import os
+import tarfile
+import threading
+import urllib.parse
 
 import gitlab
 import mock
 import toml
 
-from . import filters
+from . import (
+    aio, blobs, filters, mirrors, parse_pool, setup_parser, utils)
+from .config import config
+from .parse_cache import parse_cache
+
+# bump to drop memoized results of all parsers
+PARSERS_VERSION = 1
+
+# directories listed besides repository root, see `Fetch`
+PLAN_DIRS = ('requirements',)
+
+REQUIREMENTS_FILES = ('requirements*.txt', 'reqs.txt', 'requirements/*.txt')
+
+# probed one by one, when repository tree is unavailable
+REQUIREMENTS_FILES_FALLBACK = (
+    'requirements.txt',
+    'reqs.txt',
+    'requirements_base.txt',
+    'requirements/prod.txt',
+    'requirements/live.txt',
+    'requirements/dev.txt',
+    'requirements/test.txt',
+    'requirements/tests.txt',
+)
+
+TREE = ':tree'
+
+# days, `absent_ttl` profile option; files missing at head of default
+# branch are not looked up again, till head moves; 0 disables
+ABSENT_TTL = 7
+
+# larger files in archive are only hashed, not kept
+ARCHIVE_FILE_LIMIT = 1024 * 1024
+
+# files read by collectors, fetched ahead by async engine
+FETCHED_FILES = list(REQUIREMENTS_FILES)
+
+# name -> parser of file content, see `_run_parser`
+PARSERS = {}
+
+# collect run state of current thread: `fetch` and `reads` of parser
+_local = threading.local()
 
 
 def _collect_languages(project, cached):
+    fetch = _fetch(project)
+    if fetch is not None and fetch.languages is not None:
+        return fetch.languages or False
+
+    # mirror has no languages, so they are requested only if missing
+    if fetch is not None and fetch.mirror is not None and not (
+            filters.unknown_value(cached.get(':languages'))):
+        return cached[':languages']
+
     try:
         languages_data = project.languages()
         if not languages_data:
@@ -29,16 +86,484 @@ def _collect_languages(project, cached):
 
 
 _collect_languages.cache_key = (':languages',)
+_collect_languages.files = ('*',)
+
+
+class Fetch:
+    """Files of project ref, known from one listing of repository tree.
+
+    Repository root and `PLAN_DIRS` are listed once, so existence and blob
+    ids of files there are known without requests per file. Other files
+    are looked up once: blob ids, missing files and contents are memoized
+    for the whole collect run, `calls` counts lookups and downloads.
+    """
+
+    languages = None
+
+    def __init__(self, project, ref=None):
+        self.project = project
+        self.ref = ref or _ref(project)
+        self._tree = None
+        self._dirs = None
+        # extracted from archive outside of listed directories
+        self._extra = None
+        self._blob_ids = {}
+        self._missing = set()
+        self._contents = {}
+        self.calls = collections.Counter()
+        self.mirror = mirrors.open_(
+            project.attributes.get('path_with_namespace') or '')
+
+    def close(self):
+        if self.mirror is not None:
+            self.mirror.close()
+
+    def prefetch(self, patterns):
+        """Fetch everything collectors may need at once, by async engine.
+
+        `patterns(languages)` are patterns of files collectors will read.
+        """
+        try:
+            languages, tree, dirs = aio.engine.prefetch(
+                self.project.get_id(), self.ref, patterns, PLAN_DIRS)
+        except aio.ERRORS:
+            logging.error('prefetch failed')
+            return
+
+        self.languages = languages
+        if tree is not None:
+            self._tree = {
+                path: TREE if blob_id is None else blob_id
+                for path, blob_id in tree.items()}
+            self._dirs = dirs | {
+                path for path in PLAN_DIRS if self._tree.get(path) != TREE}
+
+    def plan(self):
+        """Listed files and directories, path -> blob id or `TREE`."""
+        if self._tree is None:
+            if self.mirror is not None:
+                self._list_mirror()
+            elif not (archive_mode() and self._extract()):
+                self._list_tree()
+        return self._tree
+
+    def _list_mirror(self):
+        self._tree = {}
+        self._dirs = set()
+        for path in ('',) + PLAN_DIRS:
+            if path and self._tree.get(path) != TREE:
+                self._dirs.add(path)
+                continue
+
+            entries = self.mirror.tree('{}:{}'.format(self.ref, path))
+            for name, (sha, is_tree) in (entries or {}).items():
+                self._tree[os.path.join(path, name)] = (
+                    TREE if is_tree else sha)
+            self._dirs.add(path)
+
+    def _list_tree(self):
+        self._tree = {}
+        self._dirs = set()
+        try:
+            self._list('')
+            for path in PLAN_DIRS:
+                if self._tree.get(path) == TREE:
+                    self._list(path)
+                else:
+                    self._dirs.add(path)
+        except gitlab.exceptions.GitlabError:
+            logging.error('repository tree list failed')
+            self._dirs = set()
+
+    def _extract(self):
+        """Tree of listed directories and collected files, from archive.
+
+        Archive is read as stream: files parsed by collectors, see
+        `FETCHED_FILES`, go to blob store, other files of listed directories
+        are only hashed. Files, read by setup.py, are downloaded on demand.
+        """
+        dirs = {''} | set(PLAN_DIRS)
+        tree = {}
+        extra = {}
+
+        try:
+            response = self.project.manager.gitlab.http_get(
+                '/projects/{}/repository/archive.tar.gz'.format(
+                    self.project.get_id()),
+                {'sha': self.ref}, streamed=True)
+        except gitlab.exceptions.GitlabHttpError as exc:
+            if exc.response_code != 404:
+                logging.error('repository archive failed')
+                return False
+            # empty repository
+            response = None
+
+        try:
+            if response is not None:
+                response.raw.decode_content = True
+                with tarfile.open(fileobj=response.raw, mode='r|gz') as tar:
+                    for member in tar:
+                        path = _normalize_path(member.name.partition('/')[2])
+                        if not path:
+                            continue
+
+                        if '/' in path:
+                            tree.setdefault(path.split('/', 1)[0], TREE)
+                        if member.isdir():
+                            if os.path.dirname(path) in dirs:
+                                tree[path] = TREE
+                            continue
+                        if not member.isfile():
+                            continue
+
+                        listed = os.path.dirname(path) in dirs
+                        parsed = any(
+                            fnmatch.fnmatch(path, pattern)
+                            for pattern in FETCHED_FILES)
+                        if not listed and not parsed:
+                            continue
+
+                        blob_id = _blob_hash(
+                            tar.extractfile(member), member.size,
+                            parsed and member.size <= ARCHIVE_FILE_LIMIT)
+                        (tree if listed else extra)[path] = blob_id
+        except (tarfile.TarError, OSError, ValueError):
+            logging.error('repository archive read failed')
+            return False
+        finally:
+            if response is not None:
+                response.close()
+
+        self._tree = tree
+        self._dirs = dirs
+        self._extra = extra
+        return True
+
+    def covers(self, path):
+        self.plan()
+        return os.path.dirname(path) in self._dirs
+
+    def blob_id(self, path):
+        path = _normalize_path(path)
+        if path in self._blob_ids or path in self._missing:
+            self.calls['memo'] += 1
+        else:
+            try:
+                self._blob_ids[path] = self._blob_id(path)
+            except gitlab.exceptions.GitlabGetError:
+                self._missing.add(path)
+
+        if path in self._missing:
+            raise gitlab.exceptions.GitlabGetError('404 File Not Found', 404)
+        return self._blob_ids[path]
+
+    def skip(self, paths):
+        """Treat `paths` as missing, without looking them up."""
+        self._missing.update(paths)
+
+    def missing(self):
+        return sorted(self._missing)
+
+    def content(self, path, blob_id):
+        """Content of file with `blob_id`, downloaded once."""
+        key = blob_id or path
+        if key in self._contents:
+            self.calls['memo'] += 1
+            return self._contents[key]
+
+        content = self.read(blob_id)
+        if content is None:
+            content = blobs.store.get(blob_id)
+        if content is None:
+            self.calls['download'] += 1
+            content = _download(self.project, path, self.ref, blob_id)
+        self._contents[key] = content
+        return content
+
+    def _blob_id(self, path):
+        if not self.covers(path):
+            if self.mirror is not None:
+                found = self.mirror.get('{}:{}'.format(self.ref, path))
+                if found is None or found[1] != 'blob':
+                    raise gitlab.exceptions.GitlabGetError(
+                        '404 File Not Found', 404)
+                return found[0]
+            if self._extra is None:
+                self.calls['head'] += 1
+                return _head_file(self.project, path, self.ref)
+            # every parsed file was extracted from archive
+            if path in self._extra:
+                return self._extra[path]
+            if not any(fnmatch.fnmatch(path, pattern)
+                       for pattern in FETCHED_FILES):
+                self.calls['head'] += 1
+                return _head_file(self.project, path, self.ref)
+            raise gitlab.exceptions.GitlabGetError('404 File Not Found', 404)
+
+        blob_id = self._tree.get(path)
+        if blob_id is None or blob_id == TREE:
+            raise gitlab.exceptions.GitlabGetError('404 File Not Found', 404)
+        return blob_id
+
+    def glob(self, patterns):
+        if not self.covers(''):
+            raise gitlab.exceptions.GitlabGetError('tree is unknown')
+        return sorted(
+            path for path, blob_id in self._tree.items()
+            if blob_id != TREE and any(
+                fnmatch.fnmatch(path, pattern) for pattern in patterns))
+
+    def read(self, blob_id):
+        """Content of blob from mirror, None without mirror."""
+        if self.mirror is None:
+            return None
+        found = self.mirror.get(blob_id)
+        return found and found[2]
+
+    def head(self):
+        """Sha of last commit of ref, None if unknown."""
+        if self.mirror is not None:
+            return self.mirror.sha(self.ref)
+        try:
+            return self.project.branches.get(self.ref).commit['id']
+        except gitlab.exceptions.GitlabError:
+            return None
+
+    def listdir(self, path):
+        path = _normalize_path(path)
+        if path == '.':
+            path = ''
+        if not self.covers(os.path.join(path, '-')):
+            return []
+        return sorted(
+            os.path.basename(name) for name in self._tree
+            if os.path.dirname(name) == path)
+
+    def _list(self, path):
+        self.calls['list'] += 1
+        try:
+            items = self.project.repository_tree(
+                path=path, ref=self.ref, all=True)
+        except gitlab.exceptions.GitlabGetError as exc:
+            # empty repository or missing directory
+            if getattr(exc, 'response_code', None) != 404:
+                raise
+            items = []
 
+        for item in items:
+            if item['type'] == 'tree':
+                self._tree[item['path']] = TREE
+            elif item['type'] == 'blob':
+                self._tree[item['path']] = item['id']
+        self._dirs.add(path)
+
+
+def head_file(project, path, ref=None):
+    """Blob id of repository file, without its content."""
+    fetch = _fetch(project, ref)
+    try:
+        if fetch is not None:
+            blob_id = fetch.blob_id(path)
+        else:
+            blob_id = _head_file(project, path, ref or _ref(project))
+    except gitlab.exceptions.GitlabGetError:
+        _record_read(path, None)
+        raise
+
+    _record_read(path, blob_id)
+    return blob_id
+
+
+def read_file(project, path, ref=None):
+    """Content of repository file, downloaded only if not in blob store.
+    """
+    ref = ref or _ref(project)
+    blob_id = head_file(project, path, ref)
+
+    fetch = _fetch(project, ref)
+    if fetch is not None:
+        return fetch.content(path, blob_id).decode()
+
+    content = blobs.store.get(blob_id)
+    if content is None:
+        content = _download(project, path, ref, blob_id)
+    return content.decode()
+
+
+def _download(project, path, ref, blob_id):
+    if blob_id:
+        content = project.repository_raw_blob(blob_id)
+    else:
+        file = project.files.get(file_path=path, ref=ref)
+        content = base64.b64decode(file.content)
+        blob_id = file.blob_id
+    blobs.store.put(blob_id, content)
+    return content
+
+
+def _head_file(project, path, ref):
+    url = '/projects/{}/repository/files/{}'.format(
+        project.get_id(), urllib.parse.quote(path, safe=''))
+    try:
+        result = project.manager.gitlab.http_request(
+            'head', url, query_data={'ref': ref})
+    except gitlab.exceptions.GitlabHttpError as exc:
+        raise gitlab.exceptions.GitlabGetError(
+            exc.error_message, exc.response_code, exc.response_body)
+    return result.headers.get('X-Gitlab-Blob-Id')
+
+
+def _fetch(project, ref=None):
+    fetch = getattr(_local, 'fetch', None)
+    if fetch is None or fetch.project is not project:
+        return None
+    if ref is not None and ref != fetch.ref:
+        return None
+    return fetch
+
+
+def archive_mode():
+    return config.profile_option('collect_fetch', 'tree') == 'archive'
+
+
+def _blob_hash(file, size, keep):
+    """Git blob id of file; content is put into blob store, if `keep`."""
+    digest = hashlib.sha1(b'blob %d\0' % size)
+    if keep:
+        content = file.read()
+        digest.update(content)
+        blobs.store.put(digest.hexdigest(), content)
+    else:
+        for chunk in iter(lambda: file.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _normalize_path(path):
+    path = os.path.normpath(path)
+    return '' if path == '.' else path
+
+
+def _ref(project):
+    return project.attributes.get('default_branch') or 'master'
+
+
+def _record_read(path, blob_id):
+    reads = getattr(_local, 'reads', None)
+    if reads is not None:
+        reads.setdefault(path, blob_id)
+
+
+def _parse(func, version, project, data, raw_content):
+    """Call parser, or take its memoized result for the same content.
+
+    Parsers of python files can read other project files, blob ids of
+    them are stored with result and must be unchanged to reuse it.
+    """
+    def unchanged(memo):
+        for path, blob_id in memo['reads'].items():
+            try:
+                if head_file(project, path) != blob_id:
+                    return False
+            except gitlab.exceptions.GitlabGetError:
+                if blob_id is not None:
+                    return False
+        return True
+
+    key = parse_cache.key(
+        func.__name__, raw_content, (PARSERS_VERSION, version))
+    memo = parse_cache.get(key, unchanged)
+    if memo is not None:
+        return memo['result']
+
+    _local.reads = {}
+    try:
+        result = _run_parser(func, project, data, raw_content)
+        reads = _local.reads
+    finally:
+        _local.reads = None
+
+    results = result if isinstance(result, tuple) else (result,)
+    if not any(filters.unknown_value(r) for r in results):
+        parse_cache.put(key, {'reads': reads, 'result': result})
+    return result
+
+
+def _run_parser(func, project, data, raw_content):
+    """Result of parser, called in parse process if pool is enabled.
+
+    Parser gets content of its file and of files it has read so far; on
+    first read of other file it is stopped, file is read here and parser
+    is started again. Parsers needing project itself run here.
+    """
+    if not parse_pool.pool.enabled():
+        return func(project, data, raw_content)
+
+    files = {}
+    while True:
+        try:
+            state, value = parse_pool.pool.run(
+                _parse_in_process, func.__name__, data, raw_content, files)
+        except parse_pool.ERRORS:
+            logging.warning('%s failed in parse process', func.__name__)
+            return func(project, data, raw_content)
+        if state == 'read':
+            files[value] = _read_or_none(project, value)
+        elif state == 'project':
+            return func(project, data, raw_content)
+        else:
+            return value
+
+
+def _parse_in_process(name, data, raw_content, files):
+    try:
+        # toml inline tables can't be pickled back
+        return 'done', utils.plain(
+            PARSERS[name](_Files(files), data, raw_content))
+    except _NeedFile as exc:
+        return 'read', exc.args[0]
+    except _NeedProject:
+        return 'project', None
+
+
+class _NeedFile(Exception):
+    """Parser in process reads file, not given to it yet."""
+
+
+class _NeedProject(Exception):
+    """Parser can't run in process."""
+
+
+class _Files:
+    """Project of parser in process, only files read so far."""
+
+    def __init__(self, files):
+        self.files = files
+
+    def read(self, path):
+        if path not in self.files:
+            raise _NeedFile(path)
+        return self.files[path]
+
+
+def _parser(func):
+    """Register parser, so parse process finds it by name."""
+    PARSERS[func.__name__] = func
+    return func
+
+
+def collect_file_data(filename, *cache_keys, version=1, files=()):
+    """Collector of `filename` data; `files` are other files it may read.
+    """
+    FETCHED_FILES.append(filename)
 
-def collect_file_data(filename, *cache_keys):
     def decorator(func):
+        _parser(func)
+
         @functools.wraps(func)
         def wrap(project, cached):
             try:
-                file = project.files.get(
-                    file_path=filename,
-                    ref=project.attributes.get('default_branch', 'master'))
+                raw = read_file(project, filename)
             except gitlab.exceptions.GitlabGetError:
                 if len(cache_keys) > 1:
                     return [False] * len(cache_keys)
@@ -51,17 +576,57 @@ def collect_file_data(filename, *cache_keys):
                     return 'n/a'
 
             data = {'file': filename}
-            raw = base64.b64decode(file.content).decode()
-            return func(project, data, raw)
+            return _parse(func, version, project, data, raw)
 
         wrap.cache_key = cache_keys
+        wrap.files = (filename,) + files
 
         return wrap
     return decorator
 
 
-@collect_file_data('setup.py', ':setup.py', ':requirements')
+@collect_file_data(
+    'setup.py', ':setup.py', ':requirements',
+    files=('setup.cfg', '*.txt', '*/__init__.py', '*version*'), version=2)
 def _collect_setup_py(project, data, raw_content):
+    if isinstance(project, _Files):
+        setup_result = setup_parser.extract(raw_content, project.read)
+        if setup_result is None:
+            raise _NeedProject()
+    else:
+        setup_result = setup_parser.extract(
+            raw_content, functools.partial(_read_or_none, project))
+    if setup_result is None:
+        setup_result = _exec_setup_py(project, raw_content)
+    if setup_result is None:
+        return 'n/a', 'n/a'
+
+    if not setup_result:
+        return False, 'n/a'
+
+    # python classes are breaking cache read
+    setup_result.pop('cmdclass', None)
+
+    data.update(setup_result)
+    requirements = {}
+    if 'install_requires' in setup_result:
+        requirements['main'] = setup_result['install_requires']
+    if setup_result.get('extras_require'):
+        for k, v in setup_result['extras_require'].items():
+            requirements[k] = v
+
+    requirements = {
+        'file': 'setup.py',
+        'list': [r for reqs in requirements.values() for r in reqs],
+    }
+    return data, requirements
+
+
+def _exec_setup_py(project, raw_content):
+    """Arguments of `setup()`, taken by running setup.py, None on error.
+
+    Fallback for setup.py, which `setup_parser` can't resolve statically.
+    """
     setup_result = {}
 
     class setuptools:
@@ -123,30 +688,12 @@ def _collect_setup_py(project, data, raw_content):
             exec('\n'.join(eval_content), setup_globals, setup_globals)
         except:
             logging.exception('setup.py parse failed')
-            return 'n/a', 'n/a'
+            return None
     except:
         logging.exception('setup.py parse failed')
-        return 'n/a', 'n/a'
-
-    if not setup_result:
-        return False, 'n/a'
-
-    # python classes are breaking cache read
-    setup_result.pop('cmdclass', None)
-
-    data.update(setup_result)
-    requirements = {}
-    if 'install_requires' in setup_result:
-        requirements['main'] = setup_result['install_requires']
-    if setup_result.get('extras_require'):
-        for k, v in setup_result['extras_require'].items():
-            requirements[k] = v
+        return None
 
-    requirements = {
-        'file': 'setup.py',
-        'list': [r for reqs in requirements.values() for r in reqs],
-    }
-    return data, requirements
+    return setup_result
 
 
 def _collect_requirements(data, raw_content):
@@ -168,44 +715,42 @@ def _collect_requirements(data, raw_content):
     return data
 
 
-@collect_file_data('requirements.txt', ':requirements')
-def _collect_requirements_1(project, data, raw_content):
+@_parser
+def _parse_requirements(project, data, raw_content):
     return _collect_requirements(data, raw_content)
 
 
-@collect_file_data('reqs.txt', ':requirements')
-def _collect_requirements_2(project, data, raw_content):
-    return _collect_requirements(data, raw_content)
-
-
-@collect_file_data('requirements_base.txt', ':requirements')
-def _collect_requirements_3(project, data, raw_content):
-    return _collect_requirements(data, raw_content)
-
-
-@collect_file_data('requirements/prod.txt', ':requirements')
-def _collect_requirements_4(project, data, raw_content):
-    return _collect_requirements(data, raw_content)
-
-
-@collect_file_data('requirements/live.txt', ':requirements')
-def _collect_requirements_5(project, data, raw_content):
-    return _collect_requirements(data, raw_content)
-
+def _collect_requirements_files(project, cached):
+    fetch = _fetch(project) or Fetch(project)
+    try:
+        paths = fetch.glob(REQUIREMENTS_FILES)
+    except gitlab.exceptions.GitlabGetError:
+        paths = REQUIREMENTS_FILES_FALLBACK
 
-@collect_file_data('requirements/dev.txt', ':requirements')
-def _collect_requirements_6(project, data, raw_content):
-    return _collect_requirements(data, raw_content)
+    found = []
+    for path in paths:
+        try:
+            raw = read_file(project, path)
+        except gitlab.exceptions.GitlabGetError:
+            continue
+        except gitlab.exceptions.GitlabError:
+            return 'n/a'
+        found.append(_parse(_parse_requirements, 1, project, {
+            'file': path}, raw))
 
+    if not found:
+        return False
+    if len(found) == 1:
+        return found[0]
 
-@collect_file_data('requirements/test.txt', ':requirements')
-def _collect_requirements_7(project, data, raw_content):
-    return _collect_requirements(data, raw_content)
+    return {
+        'files': {data['file'] for data in found},
+        'list': list({line for data in found for line in data['list']}),
+    }
 
 
-@collect_file_data('requirements/tests.txt', ':requirements')
-def _collect_requirements_8(project, data, raw_content):
-    return _collect_requirements(data, raw_content)
+_collect_requirements_files.cache_key = (':requirements',)
+_collect_requirements_files.files = REQUIREMENTS_FILES
 
 
 @collect_file_data('Pipfile', ':Pipfile', ':requirements')
@@ -288,14 +833,10 @@ def _collect_gitlab_ci(project, data, raw_content):
 
 def _load_python_module(project, path):
     try:
-        version_file = project.files.get(
-            file_path=path + '.py',
-            ref=project.default_branch)
+        file_content = read_file(project, path + '.py')
     except gitlab.exceptions.GitlabGetError:
         try:
-            version_file = project.files.get(
-                file_path=path + '/__init__.py',
-                ref=project.default_branch)
+            file_content = read_file(project, path + '/__init__.py')
         except gitlab.exceptions.GitlabGetError:
             return None
 
@@ -306,7 +847,6 @@ def _load_python_module(project, path):
         'os': _fake_os,
     }
     locals_ = {}
-    file_content = base64.b64decode(version_file.content).decode()
 
     eval_content = _preload_imports(
         project, path, file_content.split('\n'), locals_, setup_globals)
@@ -466,6 +1006,13 @@ def _parse_poetry_req(package, data):
     return package + '==(complex)'
 
 
+def _read_or_none(project, path):
+    try:
+        return read_file(project, path)
+    except gitlab.exceptions.GitlabError:
+        return None
+
+
 class _fake_open:
     def __init__(self, project):
         self.project = project
@@ -485,14 +1032,10 @@ class _fake_open:
 
     def read(self, n=0):
         try:
-            file = self.project.files.get(
-                file_path=self.path,
-                ref=self.project.default_branch)
+            return read_file(self.project, self.path)
         except gitlab.exceptions.GitlabGetError:
             return None
 
-        return base64.b64decode(file.content).decode()
-
 
 def _callables(obj):
     return {
@@ -511,8 +1054,7 @@ class _fake_os:
 
         def exists(self, path):
             try:
-                self.os._project.files.get(
-                    file_path=path, ref=os._project.default_branch)
+                head_file(self.os._project, path)
             except gitlab.exceptions.GitlabGetError:
                 return False
             return True
@@ -530,9 +1072,11 @@ class _fake_os:
     def getcwd():
         return ''
 
-    @staticmethod
-    def listdir(path):
-        return []
+    def listdir(self, path):
+        fetch = _fetch(self._project)
+        if fetch is None:
+            return []
+        return fetch.listdir(path)
 
 
 CACHE_COLLECTORS = (
@@ -540,30 +1084,164 @@ CACHE_COLLECTORS = (
     (_collect_dockerfile, None),
     (_collect_gitlab_ci, None),
     (_collect_setup_py, filters.filter_lang_python),
-    (_collect_requirements_1, filters.filter_lang_python),
-    (_collect_requirements_2, filters.filter_lang_python),
-    (_collect_requirements_3, filters.filter_lang_python),
-    (_collect_requirements_4, filters.filter_lang_python),
-    (_collect_requirements_5, filters.filter_lang_python),
-    (_collect_requirements_6, filters.filter_lang_python),
-    (_collect_requirements_7, filters.filter_lang_python),
-    (_collect_requirements_8, filters.filter_lang_python),
+    (_collect_requirements_files, filters.filter_lang_python),
     (_collect_pip_file, filters.filter_lang_python),
     (_collect_pyproject, filters.filter_lang_python),
 )
 
 
-def collect(project, cached, force):
+def collect(project, cached, force, changes=None):
+    """Collected data of project.
+
+    With `changes` of `changed_paths`, only collectors of changed files
+    are run.
+    """
     if filters.filter_is_empty(cached):
         return None
 
-    collected = {}
+    planned = _planned(cached, force, changes)
+    fetch = _local.fetch = Fetch(project)
+    if fetch.mirror is not None and not mirrors.fresh(cached):
+        logging.warning('mirror is outdated, call `mirror sync`')
+        fetch.mirror = None
+    if planned and fetch.mirror is None and aio.engine.enabled() and (
+            changes is None and not archive_mode()):
+        fetch.prefetch(functools.partial(_prefetched, planned, cached))
+
+    head = changes[1] if changes else None
+    absent = None
+    started = False
+
+    def start():
+        # head and files missing at it are needed by file collectors only
+        nonlocal head, absent, started
+        started = True
+        if head is None:
+            head = fetch.head()
+        absent = _absent(cached, head)
+        if absent:
+            fetch.skip(absent['paths'])
+
+    try:
+        collected = _collect(project, cached, planned, start)
+    finally:
+        _local.fetch = None
+        fetch.close()
+        logging.debug('fetch calls: %s', dict(fetch.calls))
+
+    if head:
+        collected[':last_collected_sha'] = head
+        if started and _absent_ttl():
+            collected[':absent'] = {
+                'sha': head,
+                # known paths are checked again, when ttl is over
+                'at': absent['at'] if absent else datetime.datetime.now(),
+                'paths': fetch.missing(),
+            }
+    return collected
+
+
+def _absent(cached, head):
+    """Files known to be missing at commit `head`, and when it was seen.
+    """
+    absent = cached.get(':absent')
+    if not absent or not head or absent.get('sha') != head:
+        return None
+    if absent['at'] < datetime.datetime.now() - datetime.timedelta(
+            days=_absent_ttl()):
+        return None
+    return absent
+
+
+def _absent_ttl():
+    return float(config.profile_option('absent_ttl', ABSENT_TTL))
+
+
+def changed_paths(project, sha):
+    """Paths changed since commit `sha` and head sha of default branch.
+
+    Returns None, if changes are unknown, e.g. after force push.
+    """
+    mirror = mirrors.open_(
+        project.attributes.get('path_with_namespace') or '')
+    if mirror is not None:
+        try:
+            head = mirror.sha(_ref(project))
+            paths = head and mirror.changed_paths(sha, head)
+        finally:
+            mirror.close()
+        return None if paths is None else (paths, head)
+
+    try:
+        compare = project.repository_compare(sha, _ref(project))
+    except gitlab.exceptions.GitlabError:
+        return None
+
+    if compare.get('compare_timeout'):
+        return None
+
+    paths = set()
+    for diff in compare.get('diffs') or ():
+        paths.add(diff['old_path'])
+        paths.add(diff['new_path'])
+
+    head = (compare.get('commit') or {}).get('id') or sha
+    return paths, head
+
+
+def _affected(changes):
+    """Cache keys of collectors, reading changed files."""
+    keys = set()
+    for collector, _ in CACHE_COLLECTORS:
+        if any(fnmatch.fnmatch(path, pattern)
+               for path in changes[0] for pattern in collector.files):
+            keys.update(collector.cache_key)
+    return keys
+
+
+def _planned(cached, force, changes=None):
+    """Collectors to run, before their conditions are checked."""
+    affected = None if changes is None else _affected(changes)
+
+    planned = []
     for collector, condition in CACHE_COLLECTORS:
-        if not force and not any(filters.unknown_value(
-                cached.get(cache_key)) for cache_key in collector.cache_key):
+        known = not any(filters.unknown_value(
+            cached.get(cache_key)) for cache_key in collector.cache_key)
+        if not force and known:
+            continue
+        # collectors sharing affected key are run together, to merge it
+        if affected is not None and known and affected.isdisjoint(
+                collector.cache_key):
             continue
+        planned.append((collector, condition))
+    return planned
+
+
+def _prefetched(planned, cached, languages):
+    """Patterns of files, read by planned collectors of project with
+    `languages`, None if they are unknown."""
+    if languages is not None:
+        cached = {**cached, ':languages': languages or False}
+    patterns = []
+    for collector, condition in planned:
+        if condition is None or condition(cached):
+            patterns.extend(_fetched_files(collector))
+    return patterns
+
+
+def _fetched_files(collector):
+    return [pattern for pattern in collector.files
+            if pattern in FETCHED_FILES]
+
+
+def _collect(project, cached, planned, start=None):
+    collected = {}
+    for collector, condition in planned:
         if condition and not condition({**cached, **collected}):
             continue
+        if start is not None and _fetched_files(collector):
+            start()
+            start = None
 
         data = collector(project, cached)
         if len(collector.cache_key) == 1:
@@ -585,7 +1263,9 @@ def collect(project, cached, force):
                     reqs |= set(d.get('list', []))
                     collected[cache_key]['list'] = list(reqs)
                     files = collected[cache_key].setdefault('files', set())
-                    files.add(d.get('file'))
+                    files.update(d.get('files', ()))
+                    if d.get('file'):
+                        files.add(d['file'])
                     if collected[cache_key].get('file'):
                         files.add(collected[cache_key]['file'])
                         del collected[cache_key]['file']
@@ -1 +1 @@
-from . import info, config, cache, python, repo, collect, update
+from . import info, config, cache, python, repo, collect, update, mirror
@@ -1,7 +1,7 @@
 import gitlab
 
-from .. import apis, cli_args, errors, filters, log, utils
-from ..cache import cache
+from .. import apis, cli_args, errors, filters, http_cache, log, utils
+from ..cache import ENGINES, cache
 from ..config import config
 
 
@@ -15,15 +15,7 @@ def total(namespace):
     if namespace.all:
         namespace.exclude = ':none'
 
-    cached_search = cache.filter_map(namespace.query, False, namespace.exclude)
-
-    counts = {}
-
-    for pid, cached in cached_search.items():
-        for filter_tag, filter_ in filters.FILTERS.items():
-            counts.setdefault(filter_tag, 0)
-            if filter_(cached):
-                counts[filter_tag] += 1
+    counts = cache.counts(namespace.query, namespace.exclude)
 
     max_name = 1
     for filter_tag in filters.FILTERS.keys():
@@ -124,11 +116,6 @@ def details(namespace):
         if len(cached_search) > 1:
             log.info(cached['name'])
 
-        tags = []
-        for filter_tag, filter_ in filters.FILTERS.items():
-            if filter_(cached):
-                tags.append(filter_tag)
-
         if filters.filter_is_broken(cached):
             log.warn('Package is broken, call `repair` to fix it.')
 
@@ -140,4 +127,48 @@ def details(namespace):
                 raise errors.Error(
                     '{}: missing'.format(cached.get('name') or pid))
         else:
-            log.pprint(cached)
+            log.pprint(cache.full(pid, cached))
+
+
+@cli_args.command(name='cache', help='manage cache storage')
+@cli_args.arg(
+    'action', choices=('migrate', 'http-stats'), help='cache action')
+@cli_args.arg(
+    '-t', '--to', choices=tuple(ENGINES.keys()), default='sqlite',
+    help='target engine for migrate; by default: sqlite')
+def cache_(namespace):
+    config.load()
+
+    if namespace.action == 'migrate':
+        return _migrate(namespace.to)
+
+    if namespace.action == 'http-stats':
+        return _http_stats()
+
+
+def _migrate(target):
+    source = cache.engine()
+    if isinstance(source, ENGINES[target]):
+        raise errors.Warn('Cache already stored in {}'.format(target))
+
+    dest = ENGINES[target]()
+    dest.clear()
+    for pid, cached in source.items():
+        dest.update(pid, source.full(pid, cached))
+    dest.flush()
+    dest.close()
+
+    config.set_profile_option('cache_engine', target)
+    config.flush()
+
+    raise errors.Success('Migrated {} projects to {}'.format(
+        dest.total(), target))
+
+
+def _http_stats():
+    stats = http_cache.store.stats()
+    log.info('requests  {}'.format(stats['hits'] + stats['misses']))
+    log.info('hits      {} ({:.1%})'.format(stats['hits'], stats['hit_ratio']))
+    log.info('saved     {} bytes'.format(stats['bytes_saved']))
+    log.info('stored    {} responses, {} bytes'.format(
+        stats['entries'], stats['size']))
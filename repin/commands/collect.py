@@ -1,23 +1,100 @@
+import collections
+import concurrent.futures
+import datetime
 import pprint
+import urllib.parse
 
-from .. import apis, cli_args, errors, helpers, log
+import gitlab
+
+from .. import aio, apis, cli_args, collectors, errors, helpers, log, utils
 from ..cache import cache
 from ..config import config
+from ..parse_cache import parse_cache
+from ..scheduler import scheduler
 
 GL_PER_PAGE = 100
 
+# keyset pagination errors of old servers and unsupported list options
+KEYSET_UNSUPPORTED = (400, 405, 422)
+
+# `collect_workers` profile option
+COLLECT_WORKERS = 4
+# workers of async engine mostly wait for prefetch
+COLLECT_WORKERS_ASYNC = 32
+
+# gitlab updates last_activity_at lazily, so listing overlaps with last run
+CURSOR_OVERLAP = datetime.timedelta(hours=1)
+
 
 def iter_all(namespace, **kwargs):
     kwargs['per_page'] = GL_PER_PAGE
 
-    projects = apis.get().projects.list(as_list=False, **kwargs)
+    archived = None
+    if namespace.fast:
+        # simple representation lacks archived flag
+        kwargs['simple'] = True
+        archived = {
+            project.id for project in list_keyset(archived=True, **kwargs)}
+
+    projects = list_keyset(**kwargs)
     for project in projects:
+        if archived is not None:
+            _complete_simple(project, archived)
+
         if namespace.exclude and namespace.exclude in '{}/{}'.format(
                 project.namespace['full_path'], project.path):
             continue
         yield project
 
 
+def list_keyset(**kwargs):
+    """Projects by keyset pagination, unlike offset it is fast on any page.
+
+    Falls back to offset pagination on servers without keyset support.
+    """
+    manager = apis.get().projects
+    try:
+        return manager.list(
+            as_list=False, pagination='keyset', order_by='id', sort='asc',
+            **kwargs)
+    except gitlab.exceptions.GitlabListError as exc:
+        if exc.response_code not in KEYSET_UNSUPPORTED:
+            raise
+        log.warn('keyset pagination unsupported, using offset pagination')
+
+    return manager.list(as_list=False, **kwargs)
+
+
+def _complete_simple(project, archived):
+    project.archived = project.id in archived
+    if 'namespace' not in project.attributes:
+        # older servers omit namespace in simple representation
+        project.namespace = {
+            'full_path': project.path_with_namespace.rsplit('/', 1)[0]}
+
+
+class ListingStats:
+    """Bytes received by project listing, as requests response hook."""
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.pages = []
+
+    def __call__(self, response, *args, **kwargs):
+        if not urllib.parse.urlparse(response.url).path.endswith('/projects'):
+            return
+
+        self.pages.append(len(response.content))
+        if self.verbose:
+            log.info('page {}: {} bytes'.format(
+                len(self.pages), self.pages[-1]))
+
+    def __str__(self):
+        return 'listed {} pages, {} bytes, {} bytes per page'.format(
+            len(self.pages), sum(self.pages),
+            sum(self.pages) // max(1, len(self.pages)))
+
+
 def iter_path(namespace, **kwargs):
     group_name, project_name = namespace.query.split('/', 1)
     groups = apis.get().groups.list(search=group_name, **kwargs)
@@ -50,14 +127,25 @@ def iter_search(namespace, **kwargs):
     help='skip membership check on project search')
 @cli_args.arg(
     '-n', '--no-store', action='store_true', help='only find and output')
+@cli_args.arg(
+    '--full', action='store_true',
+    help='list all projects, not only active since last collect')
+@cli_args.arg(
+    '-f', '--fast', action='store_true',
+    help='list projects in minimal representation')
 def collect(namespace):
     if ':' in namespace.query and namespace.query != ':all':
         raise errors.Error('Collect cant use filters beside :all')
 
+    if namespace.fast and namespace.query != ':all':
+        raise errors.Error('Fast listing works only for :all')
+
     if namespace.exclude != ':archived' and ':' in namespace.exclude:
         raise errors.Error('Collect cant use filters in exclude')
 
     config.load()
+    if namespace.no_store:
+        cache.set_read_only()
 
     # TODO: 'visibility': 'private',
     list_options = {}
@@ -67,43 +155,120 @@ def collect(namespace):
     if namespace.limit:
         list_options['per_page'] = namespace.limit
 
+    cursor = None
     if namespace.query == ':all':
         it = iter_all
+        cursor = config.state('collect_cursor')
+        if cursor and not namespace.full:
+            log.info('projects active since {}'.format(cursor))
+            list_options['last_activity_after'] = (
+                _parse_date(cursor) - CURSOR_OVERLAP).isoformat() + 'Z'
     elif '/' in namespace.query:
         it = iter_path
     else:
         it = iter_search
 
+    workers = max(1, int(config.profile_option(
+        'collect_workers',
+        COLLECT_WORKERS_ASYNC if aio.engine.enabled() else COLLECT_WORKERS)))
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    stats = None
+    if namespace.fast:
+        stats = ListingStats(namespace.verbose)
+        apis.get().session.hooks['response'].append(stats)
+
+    # projects being collected, stored strictly in listing order
+    pending = collections.deque()
+    # next page is fetched while current one is collected
+    projects = utils.prefetch(
+        it(namespace, **list_options), GL_PER_PAGE * 2)
     index = new = 0
-    for index, project in enumerate(it(namespace, **list_options)):
-        if namespace.limit and index + 1 > namespace.limit:
-            cache.flush()
+    limited = interrupted = False
+    last_activity = []
+    try:
+        for index, project in enumerate(projects):
+            if namespace.limit and index + 1 > namespace.limit:
+                limited = True
+                break
+
+            cached = cache.select(project.id)
+            if not cached:
+                new += 1
+
+            pending.append((index, project, pool.submit(
+                _collect_project, project, dict(cached or {}),
+                namespace.force, namespace.update)))
+
+            while len(pending) > workers * 2 or (
+                    pending and pending[0][2].done()):
+                last_activity.append(_store(namespace, *pending.popleft()))
+
+        while pending:
+            last_activity.append(_store(namespace, *pending.popleft()))
+
+        if limited:
             log.warn('limit reached')
-            break
-
-        if not namespace.verbose:
-            log.info(project.name)
-        elif namespace.verbose == 1:
-            log.info('{} ({})'.format(project.path_with_namespace, index + 1))
-        else:
-            pprint.pprint(project.attributes)
-
-        if not cache.select(project.id):
-            new += 1
-        try:
-            helpers.add_cache(
-                project,
-                force=namespace.force,
-                save=False,
-                update=namespace.update)
-        except KeyboardInterrupt:
-            log.warn('Interrupted')
-            break
-
-        if not namespace.no_store and not index % 10:
-            cache.flush()
+
+    except KeyboardInterrupt:
+        log.warn('Interrupted')
+        interrupted = True
+        for _, _, future in pending:
+            future.cancel()
+
+    finally:
+        projects.close()
+        pool.shutdown(wait=False)
+        if stats is not None:
+            apis.get().session.hooks['response'].remove(stats)
+            log.info(str(stats))
 
     if not namespace.no_store:
         cache.flush()
 
+        # projects, skipped by limit, must be listed next time
+        if it is iter_all and namespace.update and not (
+                limited or interrupted) and namespace.exclude in (
+                    None, '', ':archived'):
+            last_activity.append(cursor or '')
+            if max(last_activity):
+                config.set_state('collect_cursor', max(last_activity))
+
+    if namespace.verbose:
+        log.info(parse_cache.stats())
+
     log.success('found {}. new {}. total {}'.format(index, new, cache.total()))
+
+
+def _collect_project(project, cached, force, update):
+    data = helpers.project_data(project)
+    collected = None
+    if update:
+        with scheduler.slot():
+            collected = collectors.collect(
+                project, {**cached, **data}, force)
+    return data, collected
+
+
+def _store(namespace, index, project, future):
+    data, collected = future.result()
+
+    if not namespace.verbose:
+        log.info(project.name)
+    elif namespace.verbose == 1:
+        log.info('{} ({})'.format(project.path_with_namespace, index + 1))
+    else:
+        pprint.pprint(project.attributes)
+
+    cache.update(project.id, data)
+    if collected:
+        cache.update(project.id, collected)
+
+    if not namespace.no_store and not index % 10:
+        cache.flush()
+
+    return data['last_activity_at'] or ''
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
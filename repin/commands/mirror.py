@@ -0,0 +1,88 @@
+import concurrent.futures
+import subprocess
+
+from .. import cli_args, errors, log, mirrors, utils
+from ..cache import cache
+from ..config import config
+
+# `mirror_workers` profile option, git processes at once
+MIRROR_WORKERS = 8
+
+
+@cli_args.command(help='manage local mirrors of repositories')
+@cli_args.arg('action', choices=('sync',), help='mirror action')
+@cli_args.query(default=':all')
+@cli_args.exact
+@cli_args.exclude()
+@cli_args.all
+@cli_args.force
+@cli_args.verbose
+def mirror(namespace):
+    config.load()
+    if not mirrors.root():
+        raise errors.Error('Set mirror_root in profile first')
+
+    if namespace.action == 'sync':
+        return _sync(namespace)
+
+
+def _sync(namespace):
+    cached_search = cache.filter_map(
+        namespace.query, namespace.exact, namespace.exclude)
+
+    utils.check_found(
+        namespace, cached_search, namespace.query == ':all' or namespace.all)
+
+    # synced before interruption are skipped
+    if not namespace.force:
+        cached_search = {
+            pid: cached for pid, cached in cached_search.items()
+            if not cached.get(':mirror') or not mirrors.fresh(cached)
+        }
+
+    workers = int(config.profile_option('mirror_workers', MIRROR_WORKERS))
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    token = config.profile_option('private_token')
+
+    tasks = {
+        pool.submit(mirrors.sync, cached, token): pid
+        for pid, cached in cached_search.items()}
+    synced = failed = 0
+    try:
+        for i, future in enumerate(concurrent.futures.as_completed(tasks)):
+            pid = tasks[future]
+            name = cached_search[pid].get('path') or pid
+            try:
+                status = future.result()
+            except subprocess.CalledProcessError as exc:
+                failed += 1
+                log.error('{}: sync failed: {}'.format(
+                    name, (exc.stderr or b'').decode().strip()))
+                continue
+            except OSError as exc:
+                # git is missing or mirror can't be written
+                failed += 1
+                log.error('{}: sync failed: {}'.format(name, exc))
+                continue
+
+            synced += 1
+            cache.update(pid, {':mirror': status})
+            if namespace.verbose:
+                log.info('{}: {} in {}s, {} bytes'.format(
+                    name, status['sha'], status['duration'],
+                    status['bytes']))
+            else:
+                log.info(name)
+
+            if not i % 10:
+                cache.flush()
+    except KeyboardInterrupt:
+        log.warn('Interrupted')
+        for future in tasks:
+            future.cancel()
+    finally:
+        pool.shutdown(wait=False)
+        cache.flush()
+
+    log.success('Synced: {}, Failed: {}, Total: {}'.format(
+        synced, failed, len(cached_search)))
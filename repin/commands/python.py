@@ -72,6 +72,8 @@ def reverse(namespace):
     utils.check_found(namespace, cached_search, message='')
 
     self_pid, cached = cached_search.popitem()
+    if self_pid is not None:
+        cached = cache.full(self_pid, cached)
 
     if filters.filter_is_package(cached):
         self_name = cached[':setup.py'].get('name', cached['name'])
@@ -1,8 +1,6 @@
-import base64
-
 import gitlab
 
-from .. import apis, cli_args, log, utils
+from .. import apis, cli_args, collectors, log, utils
 from ..cache import cache
 from ..config import config
 
@@ -43,9 +41,9 @@ def cat(namespace):
                     log.info(file['path'])
         else:
             try:
-                file = project.files.get(
-                    file_path=namespace.file,
+                content = collectors.read_file(
+                    project, namespace.file,
                     ref=namespace.branch or project.default_branch)
             except gitlab.exceptions.GitlabGetError:
                 continue
-            log.info(base64.b64decode(file.content).decode())
+            log.info(content)
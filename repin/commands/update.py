@@ -1,9 +1,12 @@
+import collections
 import concurrent.futures
+import heapq
 import time
 
-from .. import cli_args, errors, helpers, log, utils
+from .. import cli_args, errors, helpers, log, scheduler, utils
 from ..cache import cache
 from ..config import config
+from ..parse_cache import parse_cache
 
 
 @cli_args.command(
@@ -13,6 +16,7 @@ from ..config import config
 @cli_args.exclude()
 @cli_args.all
 @cli_args.force
+@cli_args.verbose
 def update(namespace):
     config.load()
 
@@ -25,6 +29,7 @@ def update(namespace):
 @cli_args.exclude()
 @cli_args.all
 @cli_args.force
+@cli_args.verbose
 def repair(namespace, default=':broken'):
     config.load()
 
@@ -35,21 +40,32 @@ def repair(namespace, default=':broken'):
         namespace, cached_search, namespace.query == default or namespace.all)
 
     fixed = modified = 0
-    pool = concurrent.futures.ThreadPoolExecutor(max_workers=5)
-    retry_timeout = 2
-
-    tasks = {
-        pool.submit(
-            helpers.fix_cache,
-            pid, cached, namespace.force, default,
-        ): pid
-        for pid, cached in cached_search.items()}
-    while tasks:
-        retry = set()
-        retry_step = 1
-        try:
-            for i, feature in enumerate(concurrent.futures.as_completed(tasks)):
-                pid = tasks[feature]
+    pool = concurrent.futures.ThreadPoolExecutor(
+        max_workers=scheduler.scheduler.max_workers())
+
+    # failed projects come back one by one, after their own backoff
+    delayed = []
+    attempts = collections.Counter()
+    tasks = {}
+    for pid, cached in cached_search.items():
+        tasks[pool.submit(_fix, pid, cached, namespace.force, default)] = pid
+
+    done = 0
+    try:
+        while tasks or delayed:
+            while delayed and delayed[0][0] <= time.time():
+                _, pid = heapq.heappop(delayed)
+                tasks[pool.submit(
+                    _fix, pid, cached_search[pid], namespace.force,
+                    default)] = pid
+
+            timeout = max(0, delayed[0][0] - time.time()) if delayed else None
+            finished, _ = concurrent.futures.wait(
+                tasks, timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for feature in finished:
+                pid = tasks.pop(feature)
+                name = cache.select(pid, {}).get('name') or pid
 
                 try:
                     cached = feature.result()
@@ -58,18 +74,15 @@ def repair(namespace, default=':broken'):
                 except errors.Client as exc:
                     log.catch(exc)
 
-                except KeyError as exc:
-                    if exc.args[0] == 'retry-after':
-                        retry.add(pid)
-                    else:
-                        log.exception(
-                            '{}: package fix failed'.format(
-                                cache.select(pid, {}).get('name') or pid))
-
-                except Exception:
-                    log.exception(
-                        '{}: package fix failed'.format(
-                            cache.select(pid, {}).get('name') or pid))
+                except Exception as exc:
+                    attempts[pid] += 1
+                    if scheduler.retryable(exc) and (
+                            attempts[pid] < scheduler.RETRIES):
+                        delay = scheduler.backoff(attempts[pid])
+                        log.warn('{}: retry in {:.1f}s'.format(name, delay))
+                        heapq.heappush(delayed, (time.time() + delay, pid))
+                        continue
+                    log.exception('{}: package fix failed'.format(name))
 
                 else:
                     fixed += 1
@@ -78,29 +91,28 @@ def repair(namespace, default=':broken'):
                 if pid_modified:
                     modified += 1
 
-                if modified and not i % 10:
+                done += 1
+                if modified and not done % 10:
                     cache.flush()
-        except KeyboardInterrupt:
-            log.warn('Interrupted')
-            break
-
-        if retry:
-            log.warn('need to retry {} entries'.format(len(retry)))
-            time.sleep(retry_timeout * retry_step)
-            tasks = {
-                pool.submit(
-                    helpers.fix_cache,
-                    pid, cached, namespace.force, default,
-                ): pid
-                for pid, cached in cached_search.items()
-                if pid in retry
-            }
-            retry_step += 1
-        else:
-            break
+    except KeyboardInterrupt:
+        log.warn('Interrupted')
+        for feature in tasks:
+            feature.cancel()
+    finally:
+        pool.shutdown(wait=False)
 
     if modified:
         cache.flush()
 
+    if namespace.verbose:
+        log.info(parse_cache.stats())
+        log.info('concurrency {:.1f}, throttled {}'.format(
+            scheduler.scheduler.limit or 0, scheduler.scheduler.throttled))
+
     log.success('Fixed: {}, Modified: {}, Found: {}, Total: {}'.format(
         fixed, modified, len(cached_search), cache.total()))
+
+
+def _fix(pid, cached, force, default):
+    with scheduler.scheduler.slot():
+        return helpers.fix_cache(pid, cached, force, default)
@@ -1,10 +1,12 @@
 import configparser
+import json
 import os
 
 from . import errors
 
 CONFIG_DIR = '.repin'
 CONFIG_FILE_NAME = 'repin.yml'
+STATE_FILE_NAME = '.repin-state'
 
 
 class Config:
@@ -79,6 +81,40 @@ class Config:
     def profile_url(self):
         return self.parser.get(self.current_profile(), 'url', fallback=None)
 
+    def profile_option(self, key, fallback=None):
+        return self.parser.get(
+            self.current_profile(), key,
+            fallback=self.parser.get('global', key, fallback=fallback))
+
+    def set_profile_option(self, key, value):
+        self.parser.set(self.current_profile(), key, str(value))
+
+    def state(self, key, fallback=None):
+        """Value, saved by previous runs for current profile."""
+        return self._read_state().get(key, fallback)
+
+    def set_state(self, key, value):
+        state = self._read_state()
+        state[key] = value
+
+        root = self.profile_root()
+        if not os.path.exists(root):
+            os.makedirs(root)
+        tmp_path = self._state_path() + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(state, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._state_path())
+
+    def _read_state(self):
+        try:
+            with open(self._state_path()) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _state_path(self):
+        return os.path.join(self.profile_root(), STATE_FILE_NAME)
+
     def iter_profiles(self):
         for key, opt in self.parser.items():
             if key not in ('DEFAULT', 'global'):
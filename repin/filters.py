@@ -1,7 +1,19 @@
 import datetime
+import zlib
 
 MIN_LANG_PERCENT = 10
 
+# filters depending on current date, can't be precomputed;
+# tag -> inactive days threshold
+VOLATILE_TAGS = {
+    'old:month': 30,
+    'old:3month': 30 * 3,
+    'old:6month': 30 * 6,
+    'old:year': 365,
+    'old:2year': 365 * 2,
+    'old:4year': 365 * 4,
+}
+
 REQUIRED_KEYS_BASE = (
     'name',
     'path',
@@ -52,6 +64,8 @@ def filter_is_outdated(cached):
 
 
 def inactive_days(cached, value=None):
+    if not cached.get('last_activity_at'):
+        return None if value is None else False
     days = (datetime.date.today() - datetime.datetime.strptime(
         cached['last_activity_at'][:10], '%Y-%m-%d').date()).days
     if value is None:
@@ -183,12 +197,12 @@ FILTERS = {
     ':empty': filter_is_empty,
     ':broken': filter_is_broken,
 
-    'old:month': lambda c: inactive_days(c, 30),
-    'old:3month': lambda c: inactive_days(c, 30 * 3),
-    'old:6month': lambda c: inactive_days(c, 30 * 6),
-    'old:year': lambda c: inactive_days(c, 365),
-    'old:2year': lambda c: inactive_days(c, 365 * 2),
-    'old:4year': lambda c: inactive_days(c, 365 * 4),
+    'old:month': lambda c: inactive_days(c, VOLATILE_TAGS['old:month']),
+    'old:3month': lambda c: inactive_days(c, VOLATILE_TAGS['old:3month']),
+    'old:6month': lambda c: inactive_days(c, VOLATILE_TAGS['old:6month']),
+    'old:year': lambda c: inactive_days(c, VOLATILE_TAGS['old:year']),
+    'old:2year': lambda c: inactive_days(c, VOLATILE_TAGS['old:2year']),
+    'old:4year': lambda c: inactive_days(c, VOLATILE_TAGS['old:4year']),
 
     'lang:python': filter_lang_python,
     'lang:c++': filter_lang_factory('C++'),
@@ -218,3 +232,34 @@ FILTERS = {
     ':docker': filter_have_dockerfile,
     'ci:gitlab': filter_have_gl_ci,
 }
+
+# bump on any filter logic change to recompute stored bitmaps
+TAGS_REVISION = 1
+
+TAGS = tuple(tag for tag in FILTERS if tag not in VOLATILE_TAGS)
+TAGS_BITS = {tag: 1 << index for index, tag in enumerate(TAGS)}
+TAGS_VERSION = zlib.crc32('{}:{}'.format(
+    TAGS_REVISION, ','.join(TAGS)).encode())
+
+
+def tags_bitmap(cached):
+    bitmap = 0
+    for tag in TAGS:
+        if FILTERS[tag](cached):
+            bitmap |= TAGS_BITS[tag]
+    return bitmap
+
+
+def tags_mask(tags):
+    mask = 0
+    for tag in tags:
+        mask |= TAGS_BITS.get(tag, 0)
+    return mask
+
+
+def tags_list(bitmap, cached=None):
+    return [
+        tag for tag in FILTERS
+        if (bitmap & TAGS_BITS[tag] if tag in TAGS_BITS
+            else cached is not None and FILTERS[tag](cached))
+    ]
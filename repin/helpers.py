@@ -2,33 +2,40 @@ import datetime
 
 import gitlab
 
-from . import collectors, errors, filters, apis
+from . import collectors, errors, filters, apis, scheduler
 from .cache import cache
 
 
-def add_cache(project, force=False, save=True, update=True):
-    cached = cache.update(project.id, {
+def project_data(project):
+    """Cached fields of gitlab project."""
+    try:
+        archived = project.archived
+    except AttributeError:
+        archived = False
+
+    try:
+        default_branch = project.default_branch or ':none'
+    except AttributeError:
+        default_branch = ':none'
+
+    return {
         'name': project.name,
         'path': '{}/{}'.format(project.namespace['full_path'], project.path),
         'created_at': project.created_at,
         'last_activity_at': project.last_activity_at,
         'web_url': project.web_url,
+        'archived': archived,
+        'default_branch': default_branch,
         ':last_update_at': datetime.datetime.now(),
         ':modified': True
-    })
+    }
 
-    try:
-        cached['archived'] = project.archived
-    except AttributeError:
-        cached['archived'] = False
 
-    try:
-        cached['default_branch'] = project.default_branch or ':none'
-    except AttributeError:
-        cached['default_branch'] = ':none'
+def add_cache(project, force=False, save=True, update=True, changes=None):
+    cached = cache.update(project.id, project_data(project))
 
     if update:
-        collected = collectors.collect(project, cached, force)
+        collected = collectors.collect(project, cached, force, changes)
         if collected:
             cache.update(project.id, collected)
 
@@ -39,19 +46,28 @@ def add_cache(project, force=False, save=True, update=True):
 
 
 def fix_cache(pid, cached, force, default):
-    force = force or filters.filter_is(default, cached)
-    if not force:
+    refresh = force or filters.filter_is(default, cached)
+    if not refresh:
         raise errors.Warn('{}: not {}'.format(cached['name'], default))
 
     try:
         project = apis.get().projects.get(pid)
-    except gitlab.exceptions.GitlabGetError:
+    except gitlab.exceptions.GitlabGetError as exc:
+        if scheduler.retryable(exc):
+            raise
         if not cached.get(':lost'):
-            cached[':lost'] = True
-            cached[':modified'] = True
+            cache.update(pid, {':lost': True, ':modified': True})
         raise errors.Warn('{}: lost'.format(cached.get('name') or pid))
 
-    cached = add_cache(project, force=force, save=False, update=True)
+    # only outdated, so refresh collectors of changed files only
+    changes = None
+    if not force and cached.get(':last_collected_sha') and (
+            filters.filter_is_outdated(cached)):
+        changes = collectors.changed_paths(
+            project, cached[':last_collected_sha'])
+
+    cached = add_cache(
+        project, force=refresh, save=False, update=True, changes=changes)
 
     if filters.filter_is_broken(cached):
         raise errors.Error('{}: package not updated'.format(
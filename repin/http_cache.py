@@ -0,0 +1,268 @@
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests.adapters
+import requests.models
+import requests.structures
+import requests.utils
+
+from . import config
+
+HTTP_CACHE_NAME = '.repin-http.sqlite'
+
+# megabytes, `http_cache_size` profile option; 0 disables cache
+HTTP_CACHE_SIZE = 64
+
+# days, `http_cache_ttl` profile option
+HTTP_CACHE_TTL = 7
+
+# response header -> request header of conditional request
+VALIDATORS = (
+    ('ETag', 'If-None-Match'),
+    ('Last-Modified', 'If-Modified-Since'),
+)
+
+
+class Adapter(requests.adapters.HTTPAdapter):
+    """Transport adapter, making GET requests conditional.
+
+    Responses with validators are stored on disk; when server answers
+    304 Not Modified, stored response is returned instead.
+    """
+
+    def __init__(self, store, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.store = store
+
+    def send(self, request, stream=False, **kwargs):
+        if request.method != 'GET' or stream or not self.store.enabled():
+            return super().send(request, stream=stream, **kwargs)
+
+        key = self.store.key(request)
+        entry = self.store.get(key)
+        if entry is not None:
+            for header, condition in VALIDATORS:
+                if entry['headers'].get(header):
+                    request.headers[condition] = entry['headers'][header]
+
+        response = super().send(request, stream=stream, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            self.store.hit(key, len(entry['body']))
+            return self._restore(request, response, entry)
+
+        self.store.miss()
+        if response.status_code == 200 and any(
+                response.headers.get(header) for header, _ in VALIDATORS):
+            self.store.put(key, request.url, response)
+        return response
+
+    @staticmethod
+    def _restore(request, not_modified, entry):
+        response = requests.models.Response()
+        response.status_code = entry['status']
+        response.reason = 'OK'
+        response.headers = requests.structures.CaseInsensitiveDict(
+            entry['headers'])
+        response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers)
+        response._content = entry['body']
+        response.url = request.url
+        response.request = request
+        response.connection = not_modified.connection
+        response.elapsed = not_modified.elapsed
+        return response
+
+
+class Store:
+    """Api responses with their validators, in sqlite, with LRU eviction.
+    """
+    _db = None
+    _size = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # saved to stats table on close
+        self._counts = collections.Counter()
+
+    def enabled(self):
+        return self.limit() > 0
+
+    def limit(self):
+        return int(config.config.profile_option(
+            'http_cache_size', HTTP_CACHE_SIZE)) * 1024 * 1024
+
+    def ttl(self):
+        return float(config.config.profile_option(
+            'http_cache_ttl', HTTP_CACHE_TTL)) * 24 * 3600
+
+    def mount(self, session):
+        adapter = Adapter(self)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+    @staticmethod
+    def key(request):
+        # responses depend on user permissions
+        token = request.headers.get('PRIVATE-TOKEN') or request.headers.get(
+            'Authorization') or ''
+        return hashlib.sha1('{} {}'.format(
+            token, request.url).encode()).hexdigest()
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            row = self._open().execute(
+                'SELECT status, headers, body, stored_at FROM responses '
+                'WHERE key = ?', (key,)).fetchone()
+        finally:
+            self._lock.release()
+
+        if row is None or row[3] < time.time() - self.ttl():
+            return None
+        return {
+            'status': row[0],
+            'headers': json.loads(row[1]),
+            'body': row[2],
+        }
+
+    def put(self, key, url, response):
+        body = response.content
+        self._lock.acquire()
+        try:
+            db = self._open()
+            size = self._total_size(db)
+            # replaced response leaves the total
+            row = db.execute(
+                'SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                size -= row[0]
+
+            now = time.time()
+            db.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(key, url, status, headers, body, size, stored_at, used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+                    key, url, response.status_code,
+                    json.dumps(dict(response.headers)), body, len(body),
+                    now, now))
+            self._size = size + len(body)
+            if self._size > self.limit():
+                self._evict(db)
+            db.commit()
+        finally:
+            self._lock.release()
+
+    def hit(self, key, size):
+        self._lock.acquire()
+        try:
+            # validated again, so it lives for another ttl
+            db = self._open()
+            db.execute(
+                'UPDATE responses SET stored_at = ?, used_at = ? '
+                'WHERE key = ?', (time.time(), time.time(), key))
+            db.commit()
+            self._counts.update(hits=1, bytes_saved=size)
+        finally:
+            self._lock.release()
+
+    def miss(self):
+        self._lock.acquire()
+        try:
+            self._counts.update(misses=1)
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        self._lock.acquire()
+        try:
+            db = self._open()
+            self._save_counts(db)
+            stats = dict(db.execute('SELECT name, value FROM stats'))
+            stats['entries'], stats['size'] = db.execute(
+                'SELECT count(*), coalesce(sum(size), 0) FROM responses'
+            ).fetchone()
+        finally:
+            self._lock.release()
+
+        for name in ('hits', 'misses', 'bytes_saved'):
+            stats.setdefault(name, 0)
+        requests_ = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / requests_ if requests_ else 0.0
+        return stats
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if self._db is not None:
+                self._save_counts(self._db)
+                self._db.close()
+                self._db = None
+        finally:
+            self._lock.release()
+
+    def _evict(self, db):
+        """Drop expired, then least recently used responses to 90% of limit.
+        """
+        db.execute(
+            'DELETE FROM responses WHERE stored_at < ?',
+            (time.time() - self.ttl(),))
+
+        self._size = None
+        size = self._total_size(db)
+        limit = self.limit() * 0.9
+
+        drop = []
+        rows = db.execute('SELECT key, size FROM responses ORDER BY used_at')
+        for key, entry_size in rows:
+            if size <= limit:
+                break
+            drop.append((key,))
+            size -= entry_size
+        db.executemany('DELETE FROM responses WHERE key = ?', drop)
+        self._size = size
+
+    def _total_size(self, db):
+        if self._size is None:
+            self._size = db.execute(
+                'SELECT coalesce(sum(size), 0) FROM responses').fetchone()[0]
+        return self._size
+
+    def _save_counts(self, db):
+        for name, value in self._counts.items():
+            db.execute(
+                'INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)',
+                (name,))
+            db.execute(
+                'UPDATE stats SET value = value + ? WHERE name = ?',
+                (value, name))
+        self._counts.clear()
+        db.commit()
+
+    def _open(self):
+        if self._db is None:
+            root = config.config.profile_root()
+            if not os.path.exists(root):
+                os.makedirs(root)
+            self._db = sqlite3.connect(
+                os.path.join(root, HTTP_CACHE_NAME), check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, url TEXT, status INTEGER, '
+                'headers TEXT, body BLOB, size INTEGER, '
+                'stored_at REAL, used_at REAL)')
+            self._db.execute(
+                'CREATE INDEX IF NOT EXISTS responses_used_at '
+                'ON responses (used_at)')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS stats ('
+                'name TEXT PRIMARY KEY, value INTEGER)')
+        return self._db
+
+
+store = Store()
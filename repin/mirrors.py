@@ -0,0 +1,202 @@
+import base64
+import datetime
+import os
+import shutil
+import subprocess
+import threading
+import time
+import urllib.parse
+
+from .config import config
+
+TREE_MODE = b'40000'
+
+# `mirror_filter` profile option; blobs over limit are left on server,
+# manifests stay local, so collecting needs no network
+MIRROR_FILTER = 'blob:limit=1m'
+
+# git never asks for credentials: missing blobs of partial clone are
+# fetched inside `cat-file`, with expired token it would wait forever
+NONINTERACTIVE_ENV = {'GIT_TERMINAL_PROMPT': '0', 'GCM_INTERACTIVE': 'never'}
+
+
+class Repository:
+    """Local bare mirror, read by long-lived `git cat-file --batch`."""
+    _process = None
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+
+    def get(self, spec):
+        """Type and content of object, e.g. `master:setup.py`, or None."""
+        self._lock.acquire()
+        try:
+            process = self._open()
+            process.stdin.write(spec.encode() + b'\n')
+            process.stdin.flush()
+
+            header = process.stdout.readline().split()
+            if len(header) != 3:
+                # `<spec> missing` or `<spec> ambiguous`
+                return None
+
+            sha, type_, size = header
+            content = process.stdout.read(int(size))
+            process.stdout.read(1)
+            return sha.decode(), type_.decode(), content
+        finally:
+            self._lock.release()
+
+    def sha(self, spec):
+        found = self.get(spec)
+        return found and found[0]
+
+    def tree(self, spec):
+        """Entries of tree object, name -> (sha, is tree), or None."""
+        found = self.get(spec)
+        if found is None or found[1] != 'tree':
+            return None
+
+        entries = {}
+        content = found[2]
+        while content:
+            mode, _, content = content.partition(b' ')
+            name, _, content = content.partition(b'\0')
+            entries[name.decode()] = (content[:20].hex(), mode == TREE_MODE)
+            content = content[20:]
+        return entries
+
+    def changed_paths(self, sha, ref):
+        try:
+            output = subprocess.check_output(
+                ['git', 'diff', '--name-only', '-z', sha, ref],
+                cwd=self.path, env=_env(), stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        return {path.decode() for path in output.split(b'\0') if path}
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if self._process is not None:
+                self._process.stdin.close()
+                self._process.wait()
+                self._process = None
+        finally:
+            self._lock.release()
+
+    def _open(self):
+        if self._process is None:
+            self._process = subprocess.Popen(
+                ['git', 'cat-file', '--batch'], cwd=self.path, env=_env(),
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return self._process
+
+
+def root():
+    """Directory of mirrors, `mirror_root` profile option."""
+    path = config.profile_option('mirror_root')
+    return path and os.path.expanduser(path)
+
+
+def path(path_with_namespace):
+    return os.path.join(root(), path_with_namespace + '.git')
+
+
+def open_(path_with_namespace):
+    """Mirror of project, None if there is no mirror."""
+    if not root():
+        return None
+
+    mirror_path = path(path_with_namespace)
+    if not os.path.isdir(mirror_path):
+        return None
+    return Repository(mirror_path)
+
+
+def fresh(cached):
+    """Mirror is synced after last activity, or not synced by repin."""
+    status = cached.get(':mirror')
+    if not status:
+        return True
+    return status.get('activity', '') >= cached.get('last_activity_at', '')
+
+
+def sync(cached, token=None):
+    """Clone or fetch mirror of cached project, returns sync status.
+
+    Clone is made in temporary directory, so interrupted clone is
+    started again next time.
+    """
+    mirror_path = path(cached['path'])
+    url = cached['web_url'] + '.git'
+    if config.profile_option('mirror_ssh', 'false') == 'true':
+        url = 'git@{}:{}.git'.format(
+            urllib.parse.urlparse(cached['web_url']).hostname, cached['path'])
+
+    # token is passed per command, not stored in mirror config, and in
+    # environment, not in arguments seen by other users
+    git = ['git']
+    env = None
+    if token and not url.startswith('git@'):
+        env = _config_env('http.extraHeader', 'Authorization: Basic {}'.format(
+            base64.b64encode('oauth2:{}'.format(token).encode()).decode()))
+
+    start = time.time()
+    size = _size(mirror_path)
+    if os.path.isdir(mirror_path):
+        _git(git + ['fetch', '--prune', 'origin'], mirror_path, env)
+    else:
+        tmp_path = mirror_path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(os.path.dirname(mirror_path), exist_ok=True)
+        _git(git + [
+            'clone', '--mirror', '--quiet', '--filter={}'.format(
+                config.profile_option('mirror_filter', MIRROR_FILTER)),
+            url, tmp_path], None, env)
+        os.replace(tmp_path, mirror_path)
+
+    ref = cached.get('default_branch')
+    sha = None
+    if ref and ref != ':none':
+        repository = Repository(mirror_path)
+        try:
+            sha = repository.sha(ref)
+        finally:
+            repository.close()
+
+    return {
+        'sha': sha,
+        'activity': cached['last_activity_at'],
+        'synced_at': datetime.datetime.now(),
+        'duration': round(time.time() - start, 3),
+        'bytes': _size(mirror_path) - size,
+    }
+
+
+def _git(command, cwd, env=None):
+    subprocess.run(
+        command, cwd=cwd, env=env or _env(), check=True,
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE)
+
+
+def _env():
+    return {**os.environ, **NONINTERACTIVE_ENV}
+
+
+def _config_env(key, value):
+    """Environment with git config entry added, git 2.31+."""
+    env = _env()
+    index = int(env.get('GIT_CONFIG_COUNT') or 0)
+    env['GIT_CONFIG_COUNT'] = str(index + 1)
+    env['GIT_CONFIG_KEY_{}'.format(index)] = key
+    env['GIT_CONFIG_VALUE_{}'.format(index)] = value
+    return env
+
+
+def _size(path):
+    return sum(
+        os.path.getsize(os.path.join(dir_path, name))
+        for dir_path, _, names in os.walk(path) for name in names)
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import pickle
+import shelve
+import threading
+
+from . import config, utils
+
+PARSE_CACHE_NAME = '.repin-parsed'
+
+
+class ParseCache:
+    """Collector results by collector name, content hash and version.
+
+    Parsed files often repeat across runs and across projects generated
+    from one template, so parse results are kept between runs.
+    """
+    _shelf = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(name, content, version):
+        digest = hashlib.sha1(content.encode()).hexdigest()
+        return '{}:{}:{}'.format(name, version, digest)
+
+    def get(self, key, valid=None):
+        """Stored result, if it is there and `valid(result)` confirms it."""
+        self._lock.acquire()
+        try:
+            result = self._db().get(key)
+        finally:
+            self._lock.release()
+
+        if result is not None and (valid is None or valid(result)):
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        try:
+            dump = utils.plain(result)
+            pickle.dumps(dump)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # setup.py may put arbitrary objects into results
+            return
+
+        self._lock.acquire()
+        try:
+            self._db()[key] = dump
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        return 'parse cache: {} hits, {} misses'.format(
+            self.hits, self.misses)
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if self._shelf is not None:
+                self._shelf.close()
+                self._shelf = None
+        finally:
+            self._lock.release()
+
+    def _db(self):
+        if self._shelf is None:
+            root = config.config.profile_root()
+            if not os.path.exists(root):
+                os.makedirs(root)
+            self._shelf = shelve.open(os.path.join(root, PARSE_CACHE_NAME))
+        return self._shelf
+
+
+parse_cache = ParseCache()
@@ -0,0 +1,66 @@
+import concurrent.futures
+import concurrent.futures.process
+import multiprocessing
+import pickle
+import threading
+
+from .config import config
+
+# `parse_workers` profile option; 0 parses in collecting threads
+PARSE_WORKERS = 0
+
+# failures of pool itself or of passing values between processes,
+# parser is called in collecting thread then
+ERRORS = (
+    pickle.PicklingError, AttributeError, TypeError,
+    concurrent.futures.process.BrokenProcessPool)
+
+
+class Pool:
+    """Processes of parse stage, so parsing doesn't hold the GIL of
+    threads, fetching files.
+
+    Parsers get file contents only, see `collectors._run_parser`.
+    """
+    _executor = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def enabled(self):
+        return self.workers() > 0
+
+    def workers(self):
+        return int(config.profile_option('parse_workers', PARSE_WORKERS))
+
+    def run(self, func, *args):
+        try:
+            return self.start().submit(func, *args).result()
+        except concurrent.futures.process.BrokenProcessPool:
+            # next run starts new processes
+            self.close()
+            raise
+
+    def start(self):
+        self._lock.acquire()
+        try:
+            if self._executor is None:
+                # forked children would inherit locks of running threads
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.workers(),
+                    mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+        finally:
+            self._lock.release()
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+        finally:
+            self._lock.release()
+
+
+pool = Pool()
@@ -0,0 +1,486 @@
+"""Query language over cached projects.
+
+    query   := or
+    or      := and (('or' | '.') and)*
+    and     := not (('and' | ',') not)*
+    not     := 'not' not | '(' query ')' | term
+    term    := tag | field op value | text
+
+Tags are keys of `filters.FILTERS`; `.` works as `or` only between tags,
+like in `:archived.py:reqs:no`. Comparison operators are `=`, `==`, `!=`,
+`>`, `>=`, `<`, `<=`, `^=` (starts with), `$=` (ends with) and `~=`
+(contains), e.g. `inactive_days>365` or `path^=site/`. Any other word
+matches project path (if it contains `/`) or name; words with spaces or
+keywords are quoted, e.g. `"My Project" or 'and'`. Query of plain words
+only, which isn't valid query, is one text too, e.g. `My Project`.
+
+Query compiles once into a DAG of predicates: equal subexpressions share
+one node, evaluated at most once per project, tags are tested against
+project tag bitmap, and operands of `and`/`or` are ordered from cheap to
+expensive.
+"""
+import operator
+import re
+
+from . import errors, filters
+
+KEYWORDS = ('and', 'or', 'not')
+
+TOKEN_RE = re.compile(
+    r'\s*(?:(\()|(\))|(,)|"([^"]*)"|\'([^\']*)\'|([^\s(),"\']+))')
+# groups of quoted text
+QUOTED_GROUPS = (4, 5)
+
+# characters of query syntax besides words
+SYNTAX_CHARS = '(),:"\''
+COMPARE_RE = re.compile(r'^([\w:]+?)(==|!=|>=|<=|\^=|\$=|~=|=|>|<)(.+)$')
+
+OPERATORS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '^=': lambda a, b: str(a).startswith(str(b)),
+    '$=': lambda a, b: str(a).endswith(str(b)),
+    '~=': lambda a, b: str(b) in str(a),
+}
+
+# fields computed from project data
+FIELDS = {
+    'inactive_days': filters.inactive_days,
+}
+
+# columns of sqlite cache engine, see `cache.Sqlite`
+INDEXED_FIELDS = ('name', 'path', 'archived', 'last_activity_at')
+
+COST_BITMAP = 1
+COST_FIELD = 2
+COST_FILTER = 5
+
+
+class Node:
+    cost = COST_FIELD
+    bitmap_only = False
+    index = None
+
+    def __init__(self, *args):
+        self.args = args
+
+    def evaluate(self, context):
+        raise NotImplementedError
+
+    def evaluate_bitmap(self, bitmap):
+        raise NotImplementedError
+
+    def sql(self):
+        """Sqlite condition, selecting superset of matching projects."""
+        return None
+
+    def __call__(self, context):
+        memo = context.memo
+        if memo[self.index] is None:
+            memo[self.index] = bool(self.evaluate(context))
+        return memo[self.index]
+
+
+class Const(Node):
+    cost = 0
+    bitmap_only = True
+
+    def evaluate(self, context):
+        return self.args[0]
+
+    def evaluate_bitmap(self, bitmap):
+        return self.args[0]
+
+
+class Mask(Node):
+    """Tags test over project tag bitmap; all tags or any of them."""
+    cost = COST_BITMAP
+    bitmap_only = True
+
+    def __init__(self, mask, mode):
+        super().__init__(mask, mode)
+        self.mask = mask
+        self.mode = mode
+
+    def evaluate(self, context):
+        return self.evaluate_bitmap(context.bitmap())
+
+    def evaluate_bitmap(self, bitmap):
+        if self.mode is all:
+            return (bitmap & self.mask) == self.mask
+        return bool(bitmap & self.mask)
+
+
+class Filter(Node):
+    """Filter, which can't be precomputed, see `filters.VOLATILE_TAGS`."""
+    cost = COST_FILTER
+
+    def evaluate(self, context):
+        return filters.FILTERS[self.args[0]](context.cached)
+
+
+class Compare(Node):
+    def __init__(self, field, op, raw):
+        super().__init__(field, op, raw)
+        self.field = field
+        self.op = op
+        self.raw = raw
+        self.value = _value(raw)
+
+    def evaluate(self, context):
+        if self.field in FIELDS:
+            value = FIELDS[self.field](context.cached)
+        else:
+            value = context.cached.get(self.field)
+
+        expected = self.raw if isinstance(value, str) else self.value
+        if value is None and expected is not None:
+            return self.op == '!='
+        try:
+            return OPERATORS[self.op](value, expected)
+        except TypeError:
+            return False
+
+    def sql(self):
+        if self.field not in INDEXED_FIELDS:
+            return None
+        value = self.value if self.field == 'archived' else self.raw
+        if value is None:
+            # `col = NULL` matches nothing
+            if self.op in ('=', '=='):
+                return '{} IS NULL'.format(self.field), ()
+            return None
+        if self.op in ('=', '=='):
+            return '{} = ?'.format(self.field), (value,)
+        if self.op in ('>', '>=', '<', '<='):
+            return '{} {} ?'.format(self.field, self.op), (value,)
+        if self.op == '^=' and isinstance(value, str):
+            return '{0} >= ? AND {0} < ?'.format(self.field), (
+                value, value + '\U0010ffff')
+        return None
+
+
+class Text(Node):
+    def __init__(self, text, exact):
+        super().__init__(text, exact)
+        self.key = 'path' if '/' in text else 'name'
+        self.text = text
+        self.exact = exact
+
+    def evaluate(self, context):
+        if self.exact:
+            return self.text == context.cached.get(self.key)
+        return self.text in context.cached.get(self.key, '')
+
+    def sql(self):
+        if self.exact:
+            return '{} = ?'.format(self.key), (self.text,)
+        return 'instr({}, ?) > 0'.format(self.key), (self.text,)
+
+
+class Not(Node):
+    def __init__(self, child):
+        super().__init__(child)
+        self.child = child
+        self.cost = child.cost
+        self.bitmap_only = child.bitmap_only
+
+    def evaluate(self, context):
+        return not self.child(context)
+
+    def evaluate_bitmap(self, bitmap):
+        return not self.child.evaluate_bitmap(bitmap)
+
+
+class And(Node):
+    mode = all
+
+    def __init__(self, *children):
+        super().__init__(*children)
+        self.children = children
+        self.cost = sum(child.cost for child in children)
+        self.bitmap_only = all(child.bitmap_only for child in children)
+
+    def evaluate(self, context):
+        return self.mode(child(context) for child in self.children)
+
+    def evaluate_bitmap(self, bitmap):
+        return self.mode(
+            child.evaluate_bitmap(bitmap) for child in self.children)
+
+    def sql(self):
+        # any of conditions narrows selection, rest is checked after
+        conditions = [child.sql() for child in self.children]
+        conditions = [c for c in conditions if c]
+        if not conditions:
+            return None
+        return (
+            ' AND '.join('({})'.format(where) for where, _ in conditions),
+            tuple(arg for _, args in conditions for arg in args))
+
+
+class Or(And):
+    mode = any
+
+    def sql(self):
+        conditions = [child.sql() for child in self.children]
+        if not all(conditions):
+            return None
+        return (
+            ' OR '.join('({})'.format(where) for where, _ in conditions),
+            tuple(arg for _, args in conditions for arg in args))
+
+
+class Context:
+    __slots__ = ('cached', 'memo', '_tags', '_bitmap')
+
+    def __init__(self, cached, size, tags):
+        self.cached = cached
+        self.memo = [None] * size
+        self._tags = tags
+        self._bitmap = None
+
+    def bitmap(self):
+        if self._bitmap is None:
+            self._bitmap = self._tags(self.cached)
+        return self._bitmap
+
+
+class Predicate:
+    """Compiled query, callable over cached project."""
+
+    def __init__(self, root, size, tags):
+        self.root = root
+        self.size = size
+        self.tags = tags
+
+    def __call__(self, cached):
+        return self.root(Context(cached, self.size, self.tags))
+
+    @property
+    def bitmap_only(self):
+        return self.root.bitmap_only
+
+    def on_bitmap(self, bitmap):
+        return self.root.evaluate_bitmap(bitmap)
+
+    def sql(self):
+        return self.root.sql()
+
+
+class Compiler:
+    def __init__(self, exact=False):
+        self.exact = exact
+        self.inverse = False
+        self.nodes = {}
+        self.unknown = []
+
+    def parse(self, query):
+        try:
+            return self._parse(query)
+        except errors.Error:
+            if not _is_plain(query):
+                raise
+            # e.g. name with spaces or keywords
+            return self.node(Text, ' '.join(query.split()), self.exact)
+
+    def _parse(self, query):
+        self.tokens = _tokenize(query)
+        self.position = 0
+
+        if not self.tokens:
+            return self.node(Const, True)
+
+        root = self.parse_or()
+        if self.position < len(self.tokens):
+            raise errors.Error('Invalid query: unexpected `{}`'.format(
+                self.tokens[self.position]))
+        return root
+
+    def check(self):
+        if self.unknown:
+            raise errors.Error('Unknown filter: {}'.format(
+                ', '.join(self.unknown)))
+
+    def node(self, cls, *args):
+        key = (cls,) + args
+        if key not in self.nodes:
+            node = self.nodes[key] = cls(*args)
+            node.index = len(self.nodes) - 1
+        return self.nodes[key]
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def peek_operator(self):
+        token = self.peek()
+        return None if isinstance(token, Quoted) else token
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise errors.Error('Invalid query: unexpected end')
+        self.position += 1
+        return token
+
+    def parse_or(self):
+        # legacy comma list in exclude means "any of"
+        separators = ('or', ',') if self.inverse else ('or',)
+        children = [self.parse_and()]
+        while self.peek_operator() in separators:
+            self.take()
+            children.append(self.parse_and())
+        return self.combine(Or, children)
+
+    def parse_and(self):
+        separators = ('and',) if self.inverse else ('and', ',')
+        children = [self.parse_not()]
+        while self.peek_operator() in separators:
+            self.take()
+            children.append(self.parse_not())
+        return self.combine(And, children)
+
+    def parse_not(self):
+        token = self.take()
+        if isinstance(token, Quoted):
+            return self.node(Text, str(token), self.exact)
+        if token == 'not':
+            return self.node(Not, self.parse_not())
+        if token == '(':
+            node = self.parse_or()
+            if self.take() != ')':
+                raise errors.Error('Invalid query: `)` expected')
+            return node
+        if token in (')', ',') or token in KEYWORDS:
+            raise errors.Error('Invalid query: unexpected `{}`'.format(token))
+        return self.parse_term(token)
+
+    def parse_term(self, word):
+        if ':' in word and '.' in word and not COMPARE_RE.match(word):
+            # legacy tags alternative, inverted in exclude
+            cls = And if self.inverse else Or
+            return self.combine(cls, [self.tag(t) for t in word.split('.')])
+
+        m = COMPARE_RE.match(word)
+        if m:
+            return self.node(Compare, m.group(1), m.group(2), m.group(3))
+
+        if ':' in word:
+            return self.tag(word)
+
+        return self.node(Text, word, self.exact)
+
+    def tag(self, tag):
+        if tag not in filters.FILTERS:
+            self.unknown.append(tag)
+            return self.node(Const, False)
+        if tag in filters.VOLATILE_TAGS:
+            return self.node(Filter, tag)
+        return self.node(Mask, filters.TAGS_BITS[tag], all)
+
+    def combine(self, cls, children):
+        flat = []
+        for child in children:
+            if type(child) is cls:
+                flat.extend(child.children)
+            elif child not in flat:
+                flat.append(child)
+
+        # tags of one operator resolve by single bitmap test
+        mode = cls.mode
+        masks = [
+            child for child in flat
+            if isinstance(child, Mask) and (
+                child.mode is mode or _single_bit(child.mask))]
+        if len(masks) > 1:
+            mask = 0
+            for child in masks:
+                mask |= child.mask
+            flat = [child for child in flat if child not in masks]
+            flat.append(self.node(Mask, mask, mode))
+
+        if len(flat) == 1:
+            return flat[0]
+        flat.sort(key=lambda child: child.cost)
+        return self.node(cls, *flat)
+
+
+def compile(query, exact=False, exclude=None, tags=filters.tags_bitmap):
+    """Compile query into `Predicate`.
+
+    :param exact: match names and paths of query exactly
+    :param exclude: query of projects to skip; it keeps legacy meaning of
+        `,` as "or" and `.` as "and"
+    :param tags: tag bitmap getter, `cache.Base.tags` for indexed cache
+    """
+    compiler = Compiler(exact)
+    root = compiler.parse(query)
+    if exclude:
+        compiler.exact = False
+        compiler.inverse = True
+        root = compiler.combine(
+            And, [root, compiler.node(Not, compiler.parse(exclude))])
+    compiler.check()
+    return Predicate(root, len(compiler.nodes), tags)
+
+
+def is_text(query):
+    """Query is single name/path text."""
+    try:
+        return isinstance(Compiler().parse(query), Text)
+    except errors.Error:
+        return False
+
+
+class Quoted(str):
+    """Quoted text token, never a keyword."""
+
+
+def _tokenize(query):
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        m = TOKEN_RE.match(query, position)
+        if m is None:
+            raise errors.Error('Invalid query: unclosed quote')
+        for index, group in enumerate(m.groups(), 1):
+            if index in QUOTED_GROUPS and group is not None:
+                tokens.append(Quoted(group))
+                break
+            if group:
+                tokens.append(group)
+                break
+        position = m.end()
+    return tokens
+
+
+def _is_plain(query):
+    """Query has words only, no syntax besides keywords."""
+    return not any(char in query for char in SYNTAX_CHARS) and not any(
+        COMPARE_RE.match(word) for word in query.split())
+
+
+def _value(raw):
+    lowered = raw.lower()
+    if lowered in ('true', 'false'):
+        return lowered == 'true'
+    if lowered in ('none', 'null'):
+        return None
+    for type_ in (int, float):
+        try:
+            return type_(raw)
+        except ValueError:
+            pass
+    return raw
+
+
+def _single_bit(mask):
+    return mask & (mask - 1) == 0
@@ -0,0 +1,188 @@
+import contextlib
+import email.utils
+import math
+import random
+import threading
+import time
+
+import requests.exceptions
+
+from .config import config
+
+# `scheduler_workers` profile option, tasks in flight at start
+SCHEDULER_WORKERS = 5
+
+# `scheduler_max_workers` profile option
+SCHEDULER_MAX_WORKERS = 32
+
+# smoothed latency over best one means server is overloaded,
+# latencies under `LATENCY_FLOOR` seconds are never too slow
+LATENCY_FACTOR = 3
+LATENCY_FLOOR = 0.2
+
+# seconds; one overload, seen by many requests, decreases limit once
+DECREASE_INTERVAL = 1
+
+# seconds of pause after 429 or 503 without Retry-After
+THROTTLE_PAUSE = 2
+
+# attempts of failed task and its backoff in seconds, see `backoff`
+RETRIES = 5
+RETRY_BACKOFF = 2
+RETRY_BACKOFF_MAX = 60
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class Scheduler:
+    """Limit of api tasks in flight, adapted to server (AIMD).
+
+    Every response of api session is observed: fast ones increase limit
+    by one per limit responses, 429, 503 and growing latency halve it or
+    cut by tenth. `Retry-After` and exhausted `RateLimit-Remaining` pause
+    starting of new tasks till server is ready.
+    """
+    limit = None
+    _latency = None
+    _best = None
+    _decreased_at = 0
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.active = 0
+        self.paused_until = 0
+        self.throttled = 0
+
+    def max_workers(self):
+        return max(1, int(config.profile_option(
+            'scheduler_max_workers', SCHEDULER_MAX_WORKERS)))
+
+    def mount(self, session):
+        session.hooks['response'].append(self.observe)
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Run task, when limit and pause allow it."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self):
+        with self._condition:
+            self._start()
+            while True:
+                delay = self.paused_until - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                elif self.active >= int(self.limit):
+                    self._condition.wait()
+                else:
+                    break
+            self.active += 1
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def observe(self, response, *args, **kwargs):
+        """Response hook of api session."""
+        with self._condition:
+            self._start()
+            if response.status_code in (429, 503):
+                self._throttle(response)
+            else:
+                self._measure(response.elapsed.total_seconds())
+                self._rate_limit(response.headers)
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        with self._condition:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+            self._condition.notify_all()
+
+    def _start(self):
+        if self.limit is None:
+            workers = int(config.profile_option(
+                'scheduler_workers', SCHEDULER_WORKERS))
+            self.limit = float(max(1, min(self.max_workers(), workers)))
+
+    def _throttle(self, response):
+        self.throttled += 1
+        delay = _retry_after(response.headers)
+        if delay is None:
+            delay = THROTTLE_PAUSE
+        self.pause(delay)
+        self._decrease(0.5)
+
+        if response.status_code == 429:
+            # python-gitlab sleeps for integer Retry-After and repeats request
+            response.headers['Retry-After'] = str(math.ceil(delay))
+
+    def _measure(self, latency):
+        self._best = latency if self._best is None else min(
+            self._best, latency)
+        self._latency = latency if self._latency is None else (
+            self._latency * 0.8 + latency * 0.2)
+
+        if self._latency > max(self._best * LATENCY_FACTOR, LATENCY_FLOOR):
+            self._decrease(0.9)
+        else:
+            self.limit = min(self.max_workers(), self.limit + 1 / self.limit)
+
+    def _rate_limit(self, headers):
+        remaining = _int(headers.get('RateLimit-Remaining'))
+        reset = _int(headers.get('RateLimit-Reset'))
+        if remaining is not None and reset is not None and (
+                remaining <= self.active):
+            self.pause(reset - time.time())
+
+    def _decrease(self, factor):
+        now = time.time()
+        if now - self._decreased_at < DECREASE_INTERVAL:
+            return
+        self._decreased_at = now
+        self.limit = max(1.0, self.limit * factor)
+
+
+def retryable(exc):
+    """Task failed by overloaded or unreachable server."""
+    if isinstance(exc, (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout)):
+        return True
+    return getattr(exc, 'response_code', None) in RETRY_STATUSES
+
+
+def backoff(attempt):
+    """Seconds before attempt of task, with jitter, so failed tasks
+    don't come back at once."""
+    delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.5)
+
+
+def _retry_after(headers):
+    value = headers.get('Retry-After')
+    if value is None:
+        reset = _int(headers.get('RateLimit-Reset'))
+        return None if reset is None else max(0, reset - time.time())
+
+    if value.strip().isdigit():
+        return int(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0, date.timestamp() - time.time())
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+scheduler = Scheduler()
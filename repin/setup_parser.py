@@ -0,0 +1,748 @@
+"""Static extraction of `setup()` arguments from setup.py, without exec.
+
+Only a safe subset of python is evaluated: literals, names, string and
+list operations, simple functions, `open(...).read()` of repository files,
+`os.path` helpers and module level constants of imported project modules,
+e.g. `__version__`. Anything else makes value unresolved; if `setup()`
+call itself or its required arguments are unresolved, whole extraction
+fails and caller falls back to exec. Arguments are plain values only,
+strings and lists, built by evaluated code, are bounded by `MAX_SIZE`.
+"""
+import ast
+import importlib.util
+import operator
+import os
+import re
+import string
+import sys
+
+# extraction fails, if any of them is unresolved; others are dropped
+REQUIRED = ('name', 'version', 'install_requires', 'extras_require')
+
+SETUP_MODULES = ('setuptools', 'distutils.core', 'distutils')
+SETUP_NAMES = ('setup', 'find_packages', 'find_namespace_packages')
+
+# nested function calls and module imports
+MAX_DEPTH = 8
+
+# longest string or list, built by evaluated code
+MAX_SIZE = 1024 * 1024
+
+# widest field of `%` and `str.format` templates
+MAX_WIDTH = 100
+
+STR_METHODS = {
+    'strip', 'lstrip', 'rstrip', 'split', 'rsplit', 'splitlines',
+    'startswith', 'endswith', 'replace', 'lower', 'upper', 'join',
+    'partition', 'rpartition', 'format', 'encode', 'decode', 'find',
+}
+LIST_METHODS = {'index', 'count'}
+DICT_METHODS = {'get', 'items', 'keys', 'values'}
+
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Mod: operator.mod,
+    ast.Mult: operator.mul,
+}
+COMPARE = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+}
+
+PRIMITIVES = (str, bytes, int, float, bool, type(None))
+
+# python 3.10+; other top level modules, not importable here, are looked
+# up in repository
+STDLIB_MODULES = getattr(sys, 'stdlib_module_names', frozenset())
+
+PERCENT_RE = re.compile(
+    r'%%|%(?:\([^)]*\))?[-+ #0]*(\*|\d*)(?:\.(\*|\d*))?')
+
+
+class Unresolved(Exception):
+    """Value can't be known without running setup.py."""
+
+
+class _Return(Exception):
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+
+class _Unset:
+    """Name, assigned with unresolved value."""
+
+
+UNSET = _Unset()
+
+
+class File:
+    def __init__(self, content):
+        self.content = content
+
+    def read(self, *args):
+        return self.content
+
+    def readlines(self):
+        return self.content.splitlines(True)
+
+    def __iter__(self):
+        return iter(self.readlines())
+
+
+class Symbol:
+    """Known module or function, e.g. `os.path` or `setuptools.setup`."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, Symbol) and other.name == self.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+
+class Function:
+    def __init__(self, node, scope):
+        self.node = node
+        self.scope = scope
+
+
+class Module:
+    """Project module, evaluated on first attribute access."""
+
+    def __init__(self, parser, name):
+        self.parser = parser
+        self.name = name
+        self._scope = None
+
+    def attr(self, name):
+        if self._scope is None:
+            self._scope = self.parser.module(self.name)
+        value = self._scope.get(name, UNSET)
+        if value is UNSET:
+            submodule = '{}.{}'.format(self.name, name)
+            if self.parser.module_path(submodule):
+                return Module(self.parser, submodule)
+            raise Unresolved(name)
+        return value
+
+
+class _Lazy:
+    def __init__(self, resolve):
+        self.resolve = resolve
+
+
+class Parser:
+    def __init__(self, read):
+        self.read = read
+        self.setup = None
+        self.depth = 0
+        self._local = {}
+
+    def extract(self, source):
+        scope = {'__file__': 'setup.py', '__name__': '__main__'}
+        self.run(ast.parse(source).body, scope)
+        if self.setup is None:
+            raise Unresolved('setup')
+        return self.setup
+
+    def module(self, name):
+        """Module level names of project module."""
+        path = self.module_path(name)
+        if path is None:
+            raise Unresolved(name)
+
+        scope = {'__file__': path, '__name__': name}
+        self._enter()
+        try:
+            self.run(ast.parse(self.read(path)).body, scope, module=True)
+        finally:
+            self.depth -= 1
+        return scope
+
+    def module_path(self, name):
+        base = name.replace('.', '/')
+        for path in (
+                base + '.py', base + '/__init__.py',
+                'src/' + base + '.py', 'src/' + base + '/__init__.py'):
+            if self.read(path) is not None:
+                return path
+        return None
+
+    def is_local(self, name):
+        """Top level package of module is in repository."""
+        name = name.split('.')[0]
+        if name not in self._local:
+            self._local[name] = not _is_installed(name) and (
+                self.module_path(name) is not None)
+        return self._local[name]
+
+    # statements
+
+    def run(self, body, scope, module=False):
+        for node in body:
+            self.statement(node, scope, module)
+
+    def statement(self, node, scope, module=False):
+        if isinstance(node, ast.Expr):
+            if self._is_setup(node.value, scope):
+                if module:
+                    raise Unresolved('setup in module')
+                self.setup = self.call_setup(node.value, scope)
+            return
+
+        if isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            return self.assign(node, scope)
+
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            return self.import_(node, scope)
+
+        if isinstance(node, ast.FunctionDef):
+            scope[node.name] = Function(node, scope)
+            return
+
+        if isinstance(node, ast.Return):
+            raise _Return(
+                None if node.value is None else self.eval(node.value, scope))
+
+        if isinstance(node, ast.If):
+            try:
+                test = self.eval(node.test, scope)
+            except Unresolved:
+                return self.skip(node, scope)
+            return self.run(node.body if test else node.orelse, scope, module)
+
+        if isinstance(node, ast.With):
+            for item in node.items:
+                value = self.eval(item.context_expr, scope)
+                if item.optional_vars is not None:
+                    self.bind(item.optional_vars, value, scope)
+            return self.run(node.body, scope, module)
+
+        if isinstance(node, ast.Try):
+            # handlers are for missing imports, resolved ones are enough
+            return self.run(node.body + node.orelse, scope, module)
+
+        if isinstance(node, ast.Pass):
+            return
+
+        self.skip(node, scope)
+
+    def skip(self, node, scope):
+        """Statement can't be evaluated: its names become unresolved."""
+        for child in ast.walk(node):
+            if isinstance(child, ast.Call) and self._is_setup(child, scope):
+                raise Unresolved('conditional setup')
+            if isinstance(child, ast.Name) and isinstance(
+                    child.ctx, ast.Store):
+                scope[child.id] = UNSET
+            if isinstance(child, (ast.FunctionDef, ast.ClassDef)):
+                scope[child.name] = UNSET
+
+    def assign(self, node, scope):
+        targets = node.targets if isinstance(node, ast.Assign) else [
+            node.target]
+        try:
+            if node.value is None:
+                return
+            if isinstance(node, ast.AugAssign):
+                value = self.binop(
+                    node.op, self.eval(node.target, scope),
+                    self.eval(node.value, scope))
+            else:
+                value = self.eval(node.value, scope)
+        except Unresolved:
+            value = UNSET
+
+        for target in targets:
+            self.bind(target, value, scope)
+
+    def bind(self, target, value, scope):
+        if isinstance(target, ast.Name):
+            scope[target.id] = value
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            if value is UNSET or not isinstance(value, (tuple, list)) or len(
+                    value) != len(target.elts):
+                value = [UNSET] * len(target.elts)
+            for element, item in zip(target.elts, value):
+                self.bind(element, item, scope)
+
+    def import_(self, node, scope):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                name = alias.asname or alias.name.split('.')[0]
+                if alias.name in SETUP_MODULES:
+                    scope[name] = Symbol('setuptools')
+                elif alias.name in MODULES:
+                    scope[name] = Symbol(alias.name.split('.')[0])
+                elif not self.is_local(alias.name):
+                    scope[name] = UNSET
+                else:
+                    scope[name] = Module(self, alias.name)
+            return
+
+        if node.level or not node.module:
+            for alias in node.names:
+                scope[alias.asname or alias.name] = UNSET
+            return
+
+        for alias in node.names:
+            name = alias.asname or alias.name
+            if node.module in SETUP_MODULES and alias.name in SETUP_NAMES:
+                scope[name] = Symbol('setuptools.' + alias.name)
+            elif node.module in MODULES:
+                scope[name] = Symbol('{}.{}'.format(node.module, alias.name))
+            elif not self.is_local(node.module):
+                scope[name] = UNSET
+            else:
+                module = Module(self, node.module)
+                scope[name] = _Lazy(
+                    lambda module=module, attr=alias.name: module.attr(attr))
+
+    # setup call
+
+    def _is_setup(self, node, scope):
+        if not isinstance(node, ast.Call):
+            return False
+        if isinstance(node.func, ast.Name):
+            return scope.get(node.func.id) == Symbol('setuptools.setup')
+        if isinstance(node.func, ast.Attribute) and isinstance(
+                node.func.value, ast.Name):
+            return node.func.attr == 'setup' and scope.get(
+                node.func.value.id) == Symbol('setuptools')
+        return False
+
+    def call_setup(self, node, scope):
+        if node.args:
+            raise Unresolved('positional setup arguments')
+
+        result = {}
+        for keyword in node.keywords:
+            if keyword.arg is None:
+                kwargs = self.eval(keyword.value, scope)
+                if not isinstance(kwargs, dict):
+                    raise Unresolved('**kwargs')
+                for value in kwargs.values():
+                    self._plain(value)
+                result.update(kwargs)
+                continue
+
+            try:
+                result[keyword.arg] = self._plain(
+                    self.eval(keyword.value, scope))
+            except Unresolved:
+                if keyword.arg in REQUIRED:
+                    raise
+
+        return result
+
+    # expressions
+
+    def eval(self, node, scope):
+        method = getattr(self, '_' + node.__class__.__name__, None)
+        if method is None:
+            raise Unresolved(node.__class__.__name__)
+
+        value = method(node, scope)
+        if isinstance(value, (str, bytes, list, tuple)) and len(
+                value) > MAX_SIZE:
+            raise Unresolved('too large')
+        return value
+
+    def _Constant(self, node, scope):
+        return node.value
+
+    # python 3.7 literals and 3.8 subscripts
+
+    def _Str(self, node, scope):
+        return node.s
+
+    def _Bytes(self, node, scope):
+        return node.s
+
+    def _Num(self, node, scope):
+        return node.n
+
+    def _NameConstant(self, node, scope):
+        return node.value
+
+    def _Index(self, node, scope):
+        return self.eval(node.value, scope)
+
+    def _JoinedStr(self, node, scope):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.FormattedValue):
+                if value.format_spec is not None or value.conversion != -1:
+                    raise Unresolved('format spec')
+                parts.append(str(self._primitive(self.eval(
+                    value.value, scope))))
+            else:
+                parts.append(self.eval(value, scope))
+        return ''.join(parts)
+
+    def _Name(self, node, scope):
+        if node.id in scope:
+            value = scope[node.id]
+        elif node.id in BUILTINS:
+            value = Symbol('builtins.' + node.id)
+        else:
+            raise Unresolved(node.id)
+
+        if isinstance(value, _Lazy):
+            value = scope[node.id] = value.resolve()
+        if value is UNSET:
+            raise Unresolved(node.id)
+        return value
+
+    def _List(self, node, scope):
+        return self._items(node.elts, scope)
+
+    def _Tuple(self, node, scope):
+        return tuple(self._items(node.elts, scope))
+
+    def _Set(self, node, scope):
+        return set(self._items(node.elts, scope))
+
+    def _items(self, elements, scope):
+        items = []
+        for element in elements:
+            if isinstance(element, ast.Starred):
+                items.extend(self._iterable(self.eval(element.value, scope)))
+            else:
+                items.append(self.eval(element, scope))
+        return items
+
+    def _Dict(self, node, scope):
+        result = {}
+        for key, value in zip(node.keys, node.values):
+            if key is None:
+                unpacked = self.eval(value, scope)
+                if not isinstance(unpacked, dict):
+                    raise Unresolved('dict unpack')
+                result.update(unpacked)
+            else:
+                result[self._primitive(self.eval(key, scope))] = self.eval(
+                    value, scope)
+        return result
+
+    def _BinOp(self, node, scope):
+        return self.binop(
+            node.op, self.eval(node.left, scope), self.eval(node.right, scope))
+
+    def binop(self, op, left, right):
+        func = OPERATORS.get(op.__class__)
+        if func is None:
+            raise Unresolved(op.__class__.__name__)
+        for value in (left, right):
+            if not isinstance(value, (str, int, float, list, tuple)):
+                raise Unresolved('operand')
+        if isinstance(op, ast.Mult):
+            sequence, count = (left, right) if isinstance(right, int) else (
+                right, left)
+            if isinstance(sequence, (str, list, tuple)) and isinstance(
+                    count, int) and len(sequence) * count > MAX_SIZE:
+                raise Unresolved('too large')
+        if isinstance(op, ast.Mod) and isinstance(left, str):
+            self._percent(left, right)
+        return func(left, right)
+
+    def _percent(self, template, args):
+        if not isinstance(args, tuple):
+            args = (args,)
+        for value in args:
+            self._primitive(value)
+        for match in PERCENT_RE.finditer(template):
+            for width in match.groups():
+                if width == '*' or width and int(width) > MAX_WIDTH:
+                    raise Unresolved('format width')
+
+    def _BoolOp(self, node, scope):
+        value = None
+        for element in node.values:
+            value = self.eval(element, scope)
+            if isinstance(node.op, ast.And) and not value:
+                return value
+            if isinstance(node.op, ast.Or) and value:
+                return value
+        return value
+
+    def _UnaryOp(self, node, scope):
+        value = self.eval(node.operand, scope)
+        if isinstance(node.op, ast.Not):
+            return not value
+        if isinstance(node.op, ast.USub) and isinstance(value, (int, float)):
+            return -value
+        raise Unresolved(node.op.__class__.__name__)
+
+    def _Compare(self, node, scope):
+        left = self.eval(node.left, scope)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = self.eval(comparator, scope)
+            if not COMPARE[op.__class__](left, right):
+                return False
+            left = right
+        return True
+
+    def _IfExp(self, node, scope):
+        if self.eval(node.test, scope):
+            return self.eval(node.body, scope)
+        return self.eval(node.orelse, scope)
+
+    def _Subscript(self, node, scope):
+        value = self.eval(node.value, scope)
+        if not isinstance(value, (str, list, tuple, dict)):
+            raise Unresolved('subscript')
+        if isinstance(node.slice, ast.Slice):
+            return value[slice(*(
+                None if part is None else self.eval(part, scope)
+                for part in (node.slice.lower, node.slice.upper,
+                             node.slice.step)))]
+        return value[self.eval(node.slice, scope)]
+
+    def _Attribute(self, node, scope):
+        value = self.eval(node.value, scope)
+        if isinstance(value, Module):
+            return value.attr(node.attr)
+        if isinstance(value, Symbol):
+            name = '{}.{}'.format(value.name, node.attr)
+            if name in MODULES or name in FUNCTIONS:
+                return Symbol(name)
+            raise Unresolved(name)
+        if isinstance(value, File) and node.attr in ('read', 'readlines'):
+            return getattr(value, node.attr)
+        if isinstance(value, (str, bytes)) and node.attr in STR_METHODS:
+            if node.attr == 'format':
+                return self._format(value)
+            if node.attr == 'replace':
+                return self._replace(value)
+            if node.attr == 'join':
+                return self._join(value)
+            return getattr(value, node.attr)
+        if isinstance(value, (list, tuple)) and node.attr in LIST_METHODS:
+            return getattr(value, node.attr)
+        if isinstance(value, dict) and node.attr in DICT_METHODS:
+            return getattr(value, node.attr)
+        raise Unresolved(node.attr)
+
+    def _format(self, template):
+        def format_(*args, **kwargs):
+            for value in list(args) + list(kwargs.values()):
+                self._primitive(value)
+            for _, field, spec, _ in string.Formatter().parse(template):
+                if field and re.search(r'[.\[]', field):
+                    raise Unresolved('format attribute')
+                if spec and ('{' in spec or any(
+                        int(width) > MAX_WIDTH
+                        for width in re.findall(r'\d+', spec))):
+                    raise Unresolved('format width')
+            return template.format(*args, **kwargs)
+        return format_
+
+    @staticmethod
+    def _replace(value):
+        def replace(old, new, *args):
+            if len(value) + value.count(old) * len(new) > MAX_SIZE:
+                raise Unresolved('too large')
+            return value.replace(old, new, *args)
+        return replace
+
+    @staticmethod
+    def _join(separator):
+        def join(items):
+            items = list(items)
+            if sum(len(item) for item in items) + len(separator) * len(
+                    items) > MAX_SIZE:
+                raise Unresolved('too large')
+            return separator.join(items)
+        return join
+
+    def _Call(self, node, scope):
+        func = self.eval(node.func, scope)
+        args = self._items(node.args, scope)
+        kwargs = {}
+        for keyword in node.keywords:
+            if keyword.arg is None:
+                raise Unresolved('**kwargs')
+            kwargs[keyword.arg] = self.eval(keyword.value, scope)
+
+        if isinstance(func, Function):
+            return self.call_function(func, args, kwargs)
+        if isinstance(func, Symbol) and func.name in FUNCTIONS:
+            return FUNCTIONS[func.name](self, *args, **kwargs)
+        if callable(func) and not isinstance(func, (type, Symbol)):
+            return func(*args, **kwargs)
+        raise Unresolved('call')
+
+    def call_function(self, func, args, kwargs):
+        node = func.node
+        params = [arg.arg for arg in node.args.args]
+        if node.args.vararg or node.args.kwarg or node.args.kwonlyargs:
+            raise Unresolved('function signature')
+
+        defaults = node.args.defaults
+        local = dict(func.scope)
+        for name, default in zip(params[len(params) - len(defaults):],
+                                 defaults):
+            local[name] = self.eval(default, func.scope)
+        for name, value in zip(params, args):
+            local[name] = value
+        for name, value in kwargs.items():
+            if name not in params:
+                raise Unresolved(name)
+            local[name] = value
+        if any(name not in local for name in params):
+            raise Unresolved('missing argument')
+
+        self._enter()
+        try:
+            self.run(node.body, local)
+        except _Return as result:
+            return result.value
+        finally:
+            self.depth -= 1
+        return None
+
+    def _ListComp(self, node, scope):
+        return list(self._comprehension(node, scope))
+
+    def _GeneratorExp(self, node, scope):
+        return list(self._comprehension(node, scope))
+
+    def _SetComp(self, node, scope):
+        return set(self._comprehension(node, scope))
+
+    def _comprehension(self, node, scope):
+        if len(node.generators) != 1:
+            raise Unresolved('nested comprehension')
+
+        generator = node.generators[0]
+        local = dict(scope)
+        size = 0
+        for item in self._iterable(self.eval(generator.iter, scope)):
+            self.bind(generator.target, item, local)
+            if all(self.eval(test, local) for test in generator.ifs):
+                value = self.eval(node.elt, local)
+                size += 1 + (len(value) if isinstance(
+                    value, (str, bytes, list, tuple)) else 0)
+                if size > MAX_SIZE:
+                    raise Unresolved('too large')
+                yield value
+
+    # helpers
+
+    def _enter(self):
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            self.depth -= 1
+            raise Unresolved('too deep')
+
+    @staticmethod
+    def _iterable(value):
+        if isinstance(value, (str, list, tuple, set, dict, File)):
+            return list(value)
+        raise Unresolved('iterable')
+
+    @staticmethod
+    def _primitive(value):
+        if not isinstance(value, PRIMITIVES):
+            raise Unresolved('not primitive')
+        return value
+
+    @classmethod
+    def _plain(cls, value):
+        """Value, built of primitives and containers only."""
+        if isinstance(value, (list, tuple, set)):
+            for item in value:
+                cls._plain(item)
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                cls._primitive(key)
+                cls._plain(item)
+        else:
+            cls._primitive(value)
+        return value
+
+    def open(self, path, *args, **kwargs):
+        content = self.read(self.path(path))
+        if content is None:
+            raise Unresolved(path)
+        return File(content)
+
+    def path(self, path):
+        if not isinstance(path, str) or os.path.isabs(path):
+            raise Unresolved('path')
+        path = os.path.normpath(path)
+        if path.startswith('..'):
+            raise Unresolved('path')
+        return path
+
+
+def _is_installed(name):
+    """Top level module is stdlib or installed, like exec would import."""
+    if name in STDLIB_MODULES:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _exists(parser, path):
+    return parser.read(parser.path(path)) is not None
+
+
+def _builtin(func):
+    return lambda parser, *args, **kwargs: func(*args, **kwargs)
+
+
+MODULES = {'os', 'os.path', 'io', 'codecs'}
+
+FUNCTIONS = {
+    'builtins.open': Parser.open,
+    'io.open': Parser.open,
+    'codecs.open': Parser.open,
+    'os.path.join': _builtin(os.path.join),
+    'os.path.dirname': _builtin(os.path.dirname),
+    'os.path.basename': _builtin(os.path.basename),
+    'os.path.abspath': lambda parser, path: path,
+    'os.path.realpath': lambda parser, path: path,
+    'os.path.exists': _exists,
+    'os.path.isfile': _exists,
+    'builtins.list': _builtin(list),
+    'builtins.tuple': _builtin(tuple),
+    'builtins.dict': _builtin(dict),
+    'builtins.set': _builtin(set),
+    'builtins.sorted': _builtin(sorted),
+    'builtins.str': lambda parser, value='': str(parser._primitive(value)),
+    'builtins.len': _builtin(len),
+}
+
+BUILTINS = {
+    name.split('.', 1)[1] for name in FUNCTIONS if name.startswith('builtins.')
+}
+
+ERRORS = (
+    Unresolved, SyntaxError, ValueError, TypeError, KeyError, IndexError,
+    AttributeError, RecursionError, _Return)
+
+
+def extract(source, read):
+    """Keyword arguments of `setup()` call, None if they are unresolved.
+
+    `read(path)` returns content of repository file or None.
+    """
+    try:
+        return Parser(read).extract(source)
+    except ERRORS:
+        return None
@@ -1,4 +1,6 @@
 import itertools
+import queue
+import threading
 
 from . import errors
 
@@ -42,3 +44,55 @@ def check_found(namespace, cached_search, all_=None, message=None):
 
     check_empty(cached_search, quiet=quiet)
     check_multi(cached_search, all_, quiet, message=message)
+
+
+def plain(value):
+    """Copy of value with plain dicts, toml inline tables can't be pickled.
+    """
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(plain(v) for v in value)
+    return value
+
+
+def prefetch(iterable, size):
+    """Iterate in background thread, keeping up to `size` items ahead.
+
+    Exceptions of iteration are raised in consumer thread.
+    """
+    items = queue.Queue(maxsize=size)
+    done = object()
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as exc:
+            put((done, exc))
+        else:
+            put((done, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, exc = items.get()
+            if exc is not None:
+                raise exc
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
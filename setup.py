@@ -19,6 +19,10 @@ install_requires = [
     'toml',
 ]
 
+install_requires_async = [
+    'aiohttp',
+]
+
 install_requires_test = [
     'pytest',
     'coverage',
@@ -41,6 +45,7 @@ setup(
     platforms=CLASSIFIERS,
     install_requires=install_requires,
     extras_require={
+        'async': install_requires_async,
         'tests': install_requires_test,
     },
     entry_points={'console_scripts': [
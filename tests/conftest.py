@@ -0,0 +1,37 @@
+import pytest
+
+from repin import aio, apis, blobs, http_cache
+from repin.config import config
+from repin.parse_cache import parse_cache
+
+from . import gitlab_server
+
+
+@pytest.fixture
+def profile(tmpdir, monkeypatch):
+    """Config with one profile in temporary directory."""
+    monkeypatch.setattr(config, 'parser', config.parser.__class__())
+    monkeypatch.setattr(config, 'root', None)
+    monkeypatch.setattr(config, 'path', None)
+    config.prepare(str(tmpdir))
+    config.add_profile('fake', 'http://127.0.0.1:1', 'token')
+    config.parser.set('global', 'profile', 'fake')
+    config.flush()
+    return config
+
+
+@pytest.fixture
+def gitlab(profile, monkeypatch):
+    server = gitlab_server.Server(gitlab_server.make_projects(4))
+    profile.parser.set('fake', 'url', server.url)
+    profile.flush()
+
+    monkeypatch.setattr(apis.api, '_api', None)
+    monkeypatch.setattr(blobs.store, 'root', None)
+    parse_cache.close()
+    yield server
+
+    aio.engine.close()
+    parse_cache.close()
+    http_cache.store.close()
+    server.stop()
@@ -0,0 +1,198 @@
+"""Fake gitlab api, serving projects from memory in background thread."""
+import base64
+import collections
+import hashlib
+import http.server
+import io
+import json
+import re
+import tarfile
+import threading
+import time
+import urllib.parse
+
+SETUP_PY = '''
+from setuptools import setup
+
+with open('requirements.txt') as f:
+    requirements = f.read().split()
+
+setup(name='package-{pid}', version='1.0', install_requires=requirements)
+'''
+
+
+def blob_id(content):
+    return hashlib.sha1(
+        b'blob %d\0' % len(content) + content).hexdigest()
+
+
+def make_projects(count):
+    projects = {}
+    for pid in range(1, count + 1):
+        files = {
+            'setup.py': SETUP_PY.format(pid=pid).encode(),
+            'requirements.txt': b'requests\ntoml\n',
+            'requirements/dev.txt': b'pytest\n',
+            'Dockerfile': b'CMD ["python", "app.py"]\n',
+            '.gitlab-ci.yml': b'nexus: upload\n',
+        }
+        if pid % 2:
+            files['Pipfile'] = b'[packages]\nrequests = "*"\n'
+
+        projects[pid] = {
+            'attributes': {
+                'id': pid,
+                'name': 'project-{}'.format(pid),
+                'path': 'project-{}'.format(pid),
+                'path_with_namespace': 'group/project-{}'.format(pid),
+                'namespace': {'full_path': 'group'},
+                'created_at': '2019-01-01T00:00:00.000Z',
+                'last_activity_at': '2019-02-01T00:00:00.000Z',
+                'web_url': 'http://gitlab/group/project-{}'.format(pid),
+                'archived': False,
+                'default_branch': 'master',
+            },
+            'languages': {'Python': 90.0, 'Shell': 10.0},
+            'files': files,
+        }
+    return projects
+
+
+class Server:
+    """Gitlab api subset used by collectors, with optional latency."""
+
+    def __init__(self, projects, latency=0):
+        self.projects = projects
+        self.latency = latency
+        self.requests = collections.Counter()
+        # (method, path) -> count
+        self.paths = collections.Counter()
+        self.httpd = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), self._handler())
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_port)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def route(self, method, path, query):
+        if path == '/api/v4/projects':
+            return 200, [p['attributes'] for p in self.projects.values()]
+
+        match = re.match(r'/api/v4/projects/(\d+)(/.*)?$', path)
+        project = match and self.projects.get(int(match.group(1)))
+        if not project:
+            return 404, {'message': '404 Project Not Found'}
+
+        rest = match.group(2) or ''
+        if rest == '':
+            return 200, project['attributes']
+        if rest == '/languages':
+            return 200, project['languages']
+
+        if rest.startswith('/repository/files/'):
+            content = project['files'].get(rest[len('/repository/files/'):])
+            if content is None:
+                return 404, {'message': '404 File Not Found'}
+            return 200, {
+                'encoding': 'base64',
+                'content': base64.b64encode(content).decode(),
+                'blob_id': blob_id(content),
+            }
+
+        match = re.match(r'/repository/blobs/(\w+)/raw$', rest)
+        if match:
+            for content in project['files'].values():
+                if blob_id(content) == match.group(1):
+                    return 200, content
+            return 404, {'message': '404 Blob Not Found'}
+
+        if rest == '/repository/tree':
+            return self.tree(project, query.get('path', ''))
+        if rest == '/repository/archive.tar.gz':
+            return 200, self.archive(project)
+
+        match = re.match(r'/repository/branches/(.+)$', rest)
+        if match:
+            return 200, {
+                'name': match.group(1), 'commit': {'id': self.head(project)}}
+
+        return 404, {'message': '404 Not Found'}
+
+    @staticmethod
+    def head(project):
+        """Commit sha, changed with any file."""
+        return hashlib.sha1(json.dumps(sorted(
+            (path, blob_id(content))
+            for path, content in project['files'].items())).encode()
+        ).hexdigest()
+
+    @staticmethod
+    def tree(project, path):
+        items = {}
+        for file_path, content in project['files'].items():
+            parent, _, name = file_path.rpartition('/')
+            if parent == path:
+                items[file_path] = {
+                    'id': blob_id(content), 'name': name, 'type': 'blob',
+                    'path': file_path}
+            elif not path and parent:
+                top = parent.split('/')[0]
+                items[top] = {
+                    'id': blob_id(top.encode()), 'name': top, 'type': 'tree',
+                    'path': top}
+
+        if path and not items:
+            return 404, {'message': '404 Tree Not Found'}
+        return 200, sorted(items.values(), key=lambda item: item['path'])
+
+    @classmethod
+    def archive(cls, project):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+            for path, content in sorted(project['files'].items()):
+                info = tarfile.TarInfo('{}-{}/{}'.format(
+                    project['attributes']['path'], cls.head(project), path))
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        return buffer.getvalue()
+
+    def _handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.do_GET(head=True)
+
+            def do_GET(self, head=False):
+                url = urllib.parse.urlparse(self.path)
+                path = urllib.parse.unquote(url.path)
+                server.requests[self.command] += 1
+                server.paths[self.command, path] += 1
+                time.sleep(server.latency)
+
+                params = dict(urllib.parse.parse_qsl(url.query))
+                status, body = server.route(self.command, path, params)
+
+                headers = {}
+                if isinstance(body, bytes):
+                    headers['Content-Type'] = 'text/plain'
+                else:
+                    headers['Content-Type'] = 'application/json'
+                    if isinstance(body, dict) and 'blob_id' in body:
+                        headers['X-Gitlab-Blob-Id'] = body['blob_id']
+                    body = json.dumps(body).encode()
+
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+
+        return Handler
@@ -0,0 +1,63 @@
+import shutil
+
+import pytest
+
+from repin import aio, apis, blobs, collectors
+from repin.config import config
+
+from . import gitlab_server
+
+pytest.importorskip('aiohttp')
+
+
+def collect_all(engine):
+    config.set_profile_option('collect_engine', engine)
+    # every run downloads files again
+    blobs.store.prepare()
+    shutil.rmtree(blobs.store.root, ignore_errors=True)
+
+    result = {}
+    for project in apis.get().projects.list(all=True):
+        cached = dict(project.attributes)
+        collected = collectors.collect(project, cached, True)
+        collected[':requirements']['list'].sort()
+        # time of first lookup
+        del collected[':absent']['at']
+        result[project.id] = collected
+    return result
+
+
+def test_async_parity(gitlab):
+    expected = collect_all('sync')
+
+    assert collect_all('async') == expected
+    assert aio.engine.loop is not None
+
+
+def test_prefetch_planned(gitlab):
+    config.set_profile_option('collect_engine', 'async')
+    gitlab.projects[2]['languages'] = {'Go': 100.0}
+    projects = {
+        project.id: project for project in apis.get().projects.list(all=True)}
+
+    # keys are known, nothing is collected without force
+    cached = dict(projects[1].attributes)
+    cached.update(collectors.collect(projects[1], cached, True))
+    gitlab.paths.clear()
+    collectors.collect(projects[1], cached, False)
+    assert not any(
+        '/repository/tree' in path or '/repository/blobs/' in path
+        for _, path in gitlab.paths)
+
+    # python manifests of other languages are not downloaded
+    files = gitlab.projects[2]['files']
+    files['Dockerfile'] = b'CMD ["app"]\n'
+    files['requirements.txt'] = b'flask\n'
+    files['requirements/dev.txt'] = b'mock\n'
+    collectors.collect(projects[2], dict(projects[2].attributes), True)
+    downloaded = {
+        path for (_, path), count in gitlab.paths.items()
+        if path.startswith('/api/v4/projects/2/repository/blobs/')}
+    assert downloaded == {
+        '/api/v4/projects/2/repository/blobs/{}/raw'.format(
+            gitlab_server.blob_id(files['Dockerfile']))}
@@ -0,0 +1,244 @@
+import datetime
+import os
+import pickle
+
+import pytest
+
+from repin import cache as cache_
+from repin import filters
+
+SETUP_PY = {'file': 'setup.py', 'name': 'pkg', 'version': '1.0'}
+
+
+@pytest.fixture(params=sorted(cache_.ENGINES))
+def engine(request, profile):
+    engines = []
+
+    def open_():
+        engines.append(cache_.ENGINES[request.param]())
+        return engines[-1]
+
+    yield open_
+
+    for opened in engines:
+        opened.close()
+
+
+def project(**data):
+    return {
+        'name': 'pkg', 'path': 'group/pkg', 'archived': False,
+        'last_activity_at': '2019-01-01T00:00:00Z', **data}
+
+
+@pytest.mark.parametrize('value', [False, 'n/a'])
+def test_heavy_replaced(engine, value):
+    cache = engine()
+    cache.update(1, project(**{':setup.py': dict(SETUP_PY)}))
+    cache.flush()
+    assert cache.full(1)[':setup.py'] == SETUP_PY
+
+    cache.update(1, {':setup.py': value})
+    assert cache.full(1)[':setup.py'] == value
+    cache.flush()
+    assert cache.heavy(1) == {}
+    cache.close()
+
+    cache = engine()
+    assert cache.full(1)[':setup.py'] == value
+    assert cache.heavy(1) == {}
+
+
+def test_heavy_kept(engine):
+    cache = engine()
+    cache.update(1, project(**{':setup.py': dict(SETUP_PY)}))
+    cache.flush()
+    cache.update(1, {'archived': True})
+    cache.flush()
+    cache.close()
+
+    cache = engine()
+    assert cache.select(1)[':setup.py'] == {
+        'name': 'pkg', cache_.HEAVY_STUB: True}
+    assert cache.full(1)[':setup.py'] == SETUP_PY
+
+
+def test_sqlite_flush_updated(profile, monkeypatch):
+    cache = cache_.Sqlite()
+    for pid in range(1, 4):
+        cache.update(pid, project(name='pkg{}'.format(pid)))
+    cache.flush()
+    cache.close()
+
+    cache = cache_.Sqlite()
+    assert len(list(cache.items())) == 3
+    dumps = []
+    monkeypatch.setattr(cache_.pickle, 'dumps', lambda value: dumps.append(
+        value['name']) or b'')
+    cache.update(2, {'archived': True})
+    cache.flush()
+    cache.flush()
+    assert dumps == ['pkg2']
+
+
+@pytest.mark.parametrize('query, found', [
+    ('name=gamma', [1]),
+    ('name=alpha', []),
+    ('gamma', [1, 4]),
+    ('archived=none', [2]),
+    ('archived=false and name^=de', [3]),
+])
+def test_filter_map(engine, query, found):
+    cache = engine()
+    cache.update(1, project(name='alpha'))
+    cache.update(2, project(name='beta', archived=None))
+    cache.update(3, project(name='delta'))
+    cache.flush()
+    # changed and new projects, not flushed yet
+    cache.update(1, {'name': 'gamma'})
+    cache.update(4, project(name='gamma2'))
+
+    assert sorted(cache.filter_map(query, False)) == found
+
+
+def test_journal_replay(profile):
+    cache = cache_.Yaml()
+    cache.update(1, project())
+    cache.update(2, project(name='other'))
+    cache.flush()
+    cache.update(1, {'archived': True})
+    cache.delete(2)
+    cache.flush()
+    cache.update(3, project(name='new'))
+    cache.flush()
+
+    # unclean shutdown: no close, last record is cut
+    record = pickle.dumps((4, project(name='lost')))
+    with open(cache._journal_path, 'ab') as f:
+        f.write(record[:len(record) // 2])
+
+    cache = cache_.Yaml()
+    assert sorted(cache.ensure()) == [1, 3]
+    assert cache.select(1)['archived'] is True
+    assert cache.select(3)['name'] == 'new'
+
+
+def test_journal_no_store(profile):
+    cache = cache_.Yaml()
+    cache.update(1, project())
+    cache.flush()
+    cache.update(2, project(name='other'))
+    cache.flush()
+    with open(cache.path, 'rb') as f:
+        snapshot = f.read()
+
+    cache = cache_.Yaml()
+    cache.set_read_only()
+    cache.update(1, {'archived': True})
+    cache.flush()
+    cache.close()
+
+    with open(cache.path, 'rb') as f:
+        assert f.read() == snapshot
+    assert os.path.exists(cache._journal_path)
+    cache = cache_.Yaml()
+    assert cache.select(1)['archived'] is False
+    assert cache.select(2)['name'] == 'other'
+
+
+def test_no_store(engine):
+    cache = engine()
+    cache.update(1, project())
+    cache.flush()
+    cache.close()
+
+    cache = engine()
+    cache.set_read_only()
+    cache.update(1, {'archived': True})
+    cache.update(2, project(name='other'))
+    cache.flush()
+    cache.close()
+
+    cache = engine()
+    assert cache.select(1)['archived'] is False
+    assert cache.select(2) is None
+
+
+@pytest.mark.parametrize(
+    'damage', ['stale', 'garbage', 'truncated', 'foreign'])
+def test_snapshot_rejected(profile, damage):
+    cache = cache_.Yaml()
+    cache.update(1, project())
+    cache.flush()
+    cache.close()
+    with open(cache._binary_path, 'rb') as f:
+        binary = f.read()
+
+    if damage == 'stale':
+        # yaml snapshot edited by hand keeps its size and mtime
+        stat = os.stat(cache.path)
+        with open(cache.path) as f:
+            content = f.read()
+        with open(cache.path, 'w') as f:
+            f.write(content.replace('pkg', 'pkx'))
+        os.utime(cache.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    else:
+        with open(cache._binary_path, 'wb') as f:
+            f.write({
+                'garbage': b'garbage',
+                'truncated': binary[:-10],
+                # class of other program
+                'foreign': b'cmissing_module\nSignature\n.',
+            }[damage])
+
+    cache = cache_.Yaml()
+    expected = 'pkx' if damage == 'stale' else 'pkg'
+    assert cache.select(1)['name'] == expected
+    with open(cache._binary_path, 'rb') as f:
+        signature = pickle.load(f)
+        assert pickle.load(f)[1]['name'] == expected
+    assert signature == cache._signature()
+
+
+def test_counters(engine):
+    today = datetime.date.today().isoformat() + 'T00:00:00Z'
+    cache = engine()
+    cache.update(1, project())
+    cache.update(2, project(archived=True))
+    cache.update(3, project(last_activity_at=today))
+    cache.update(4, project(last_activity_at=None))
+    assert cache.counts()[':all'] == 4
+
+    cache.update(1, {'archived': True, 'last_activity_at': today})
+    cache.update(2, {'archived': False})
+    cache.update(5, project(name='new'))
+    cache.delete(3)
+    counts = cache.counts()
+
+    # recount of all projects
+    cache._counters = None
+    assert cache.counts() == counts
+    assert counts[':all'] == 4
+    assert counts[':archived'] == 1
+    # project without activity date is not old
+    assert counts['old:month'] == 2
+    assert cache.filter_map('old:month', False).keys() == {2, 5}
+
+
+def test_retag(engine, monkeypatch):
+    cache = engine()
+    cached = cache.update(1, project(archived=True))
+    bitmap = cached[':tags'][1]
+    assert bitmap & filters.TAGS_BITS[':archived']
+    # bitmap, stored by older filters
+    cached[':tags'] = [cached[':tags'][0], 0]
+    cache.flush()
+    cache.close()
+
+    version = filters.TAGS_VERSION + 1
+    monkeypatch.setattr(filters, 'TAGS_VERSION', version)
+    cache = engine()
+    assert cache.counts()[':archived'] == 1
+    cache.close()
+
+    cache = engine()
+    assert cache.select(1)[':tags'] == [version, bitmap]
@@ -0,0 +1,143 @@
+from repin import apis, blobs, collectors, parse_pool
+from repin.config import config
+
+from . import gitlab_server
+
+SETUP_PY = '''
+import os
+from setuptools import setup
+from pkg.version import VERSION
+
+if os.path.exists('pkg/version.py'):
+    with open('pkg/version.py') as f:
+        f.read()
+
+setup(name='pkg', version=VERSION, install_requires=open(
+    'requirements.txt').read().split())
+'''
+
+
+def test_fetch_memo(gitlab):
+    files = gitlab.projects[1]['files']
+    files['setup.py'] = SETUP_PY.encode()
+    files['pkg/version.py'] = b'VERSION = "2.0"\n'
+
+    project = apis.get().projects.get(1)
+    collected = collectors.collect(project, dict(project.attributes), True)
+
+    assert collected[':setup.py']['version'] == '2.0'
+    assert collected[':setup.py']['install_requires'] == ['requests', 'toml']
+    # exists, open and import of pkg/version.py ask server only once
+    assert gitlab.paths[
+        'HEAD', '/api/v4/projects/1/repository/files/pkg/version.py'] == 1
+    assert max(
+        count for (method, _), count in gitlab.paths.items()
+        if method == 'HEAD') == 1
+
+
+def test_parse_pool(gitlab, monkeypatch):
+    files = gitlab.projects[1]['files']
+    files['setup.py'] = SETUP_PY.encode()
+    files['pkg/version.py'] = b'VERSION = "2.0"\n'
+    # not resolved statically, parsed by exec in collecting thread
+    files = gitlab.projects[2]['files']
+    files['setup.py'] = files['setup.py'].replace(
+        b"version='1.0'", b"version=str(sum([1, 0]))")
+    # toml inline tables are passed back from parse process
+    gitlab.projects[3]['files']['pyproject.toml'] = (
+        b'[tool.poetry.dependencies]\n'
+        b'python = "^3.6"\n'
+        b'toml = {version = "0.10", optional = true}\n')
+
+    def collect_all():
+        result = {}
+        for project in apis.get().projects.list(all=True):
+            collected = collectors.collect(
+                project, dict(project.attributes), True)
+            collected[':requirements']['list'].sort()
+            # time of first lookup
+            del collected[':absent']['at']
+            result[project.id] = collected
+        return result
+
+    expected = collect_all()
+    # parsers are memoized by content
+    monkeypatch.setattr(
+        collectors, 'PARSERS_VERSION', collectors.PARSERS_VERSION + 1)
+    config.set_profile_option('parse_workers', 2)
+    try:
+        assert collect_all() == expected
+        assert parse_pool.pool._executor is not None
+    finally:
+        parse_pool.pool.close()
+
+    assert expected[1][':setup.py']['version'] == '2.0'
+    assert expected[2][':setup.py']['version'] == '1'
+    assert expected[3]['pyproject.toml']['tool']['poetry']['dependencies'][
+        'toml'] == {'version': '0.10', 'optional': True}
+
+
+def test_absent_files(gitlab):
+    files = gitlab.projects[1]['files']
+    files['setup.py'] = b'''
+import os
+from setuptools import setup
+
+extra = []
+if os.path.exists('docs/requirements.txt'):
+    extra = open('docs/requirements.txt').read().split()
+
+setup(name='pkg', version='1.0', install_requires=extra)
+'''
+    project = apis.get().projects.get(1)
+    cached = dict(project.attributes)
+    cached.update(collectors.collect(project, cached, True))
+    assert 'docs/requirements.txt' in cached[':absent']['paths']
+
+    gitlab.paths.clear()
+    collected = collectors.collect(project, cached, True)
+    assert collected[':absent'] == cached[':absent']
+    assert not any(method == 'HEAD' for method, _ in gitlab.paths)
+
+    # new commit, files are looked up again
+    files['docs/requirements.txt'] = b'toml\n'
+    collected = collectors.collect(project, cached, True)
+    assert 'docs/requirements.txt' not in collected[':absent']['paths']
+    assert collected[':setup.py']['install_requires'] == ['toml']
+
+
+def test_archive(gitlab):
+    files = gitlab.projects[1]['files']
+    files['setup.py'] = SETUP_PY.encode()
+    files['pkg/version.py'] = b'VERSION = "2.0"\n'
+    files['docs/notes.txt'] = b'not parsed\n'
+
+    project = apis.get().projects.get(1)
+    expected = collectors.collect(project, dict(project.attributes), True)
+
+    config.set_profile_option('collect_fetch', 'archive')
+    gitlab.paths.clear()
+    collected = collectors.collect(project, dict(project.attributes), True)
+    del expected[':absent']['at'], collected[':absent']['at']
+    assert collected == expected
+    assert gitlab.paths[
+        'GET', '/api/v4/projects/1/repository/archive.tar.gz'] == 1
+
+    # parsed files are kept, others are downloaded on demand
+    for path, kept in [('requirements.txt', True),
+                       ('requirements/dev.txt', True),
+                       ('docs/notes.txt', False)]:
+        blob_id = gitlab_server.blob_id(files[path])
+        assert (blobs.store.get(blob_id) is not None) is kept
+
+
+def test_nothing_to_collect(gitlab):
+    project = apis.get().projects.get(1)
+    cached = dict(project.attributes)
+    cached.update(collectors.collect(project, cached, True))
+
+    # known keys, head of branch isn't asked either
+    gitlab.paths.clear()
+    collected = collectors.collect(project, cached, False)
+    assert not gitlab.paths
+    assert ':last_collected_sha' not in collected
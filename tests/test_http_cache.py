@@ -0,0 +1,45 @@
+import os
+import sqlite3
+
+import requests.models
+
+from repin import http_cache
+
+
+def response(body):
+    result = requests.models.Response()
+    result.status_code = 200
+    result.headers['ETag'] = '"{}"'.format(len(body))
+    result._content = body
+    return result
+
+
+def test_replaced_size(profile):
+    store = http_cache.Store()
+    try:
+        store.put('a', 'http://gitlab/a', response(b'x' * 100))
+        store.put('b', 'http://gitlab/b', response(b'x' * 10))
+        # revalidated responses replace stored ones
+        for _ in range(3):
+            store.put('a', 'http://gitlab/a', response(b'x' * 50))
+        assert store._size == 60
+        assert store.stats()['size'] == 60
+    finally:
+        store.close()
+
+
+def test_hit_committed(profile, monkeypatch):
+    store = http_cache.Store()
+    try:
+        store.put('a', 'http://gitlab/a', response(b'x'))
+        monkeypatch.setattr(http_cache.time, 'time', lambda: 2e9)
+        store.hit('a', 1)
+
+        # seen by other process, without close
+        db = sqlite3.connect(os.path.join(
+            profile.profile_root(), http_cache.HTTP_CACHE_NAME))
+        assert db.execute('SELECT used_at FROM responses').fetchone() == (
+            2e9,)
+        db.close()
+    finally:
+        store.close()
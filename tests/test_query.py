@@ -0,0 +1,67 @@
+import pytest
+
+from repin import errors, filters, query
+
+PROJECTS = {
+    1: {'name': 'pages', 'path': 'site/pages', 'archived': False,
+        'last_activity_at': '2019-01-01T00:00:00'},
+    2: {'name': 'py', 'path': 'site/py', 'archived': True,
+        'last_activity_at': '2019-06-01T00:00:00'},
+    3: {'name': 'tools', 'path': 'ops/tools', 'archived': False,
+        'last_activity_at': '2018-01-01T00:00:00'},
+}
+
+
+def find(query_, exact=False, exclude=None):
+    predicate = query.compile(query_, exact, exclude)
+    return {pid for pid, cached in PROJECTS.items() if predicate(cached)}
+
+
+@pytest.mark.parametrize('query_, exclude, found', [
+    ('', None, {1, 2, 3}),
+    ('site/', None, {1, 2}),
+    ('p', ':archived', {1}),
+    (':archived', None, {2}),
+    (':archived.:active', None, {1, 2, 3}),
+    (':all', ':archived,:none', {1, 3}),
+    ('path^=site/ and not :archived', None, {1}),
+    ('(name=tools or archived=true) and last_activity_at<2019', None, {3}),
+    ('not (site/ or tools)', None, set()),
+])
+def test_compile(query_, exclude, found):
+    assert find(query_, exclude=exclude) == found
+
+
+def test_compile_exact():
+    assert find('pages', exact=True) == {1}
+    assert find('page', exact=True) == set()
+
+
+def test_compile_shares_nodes():
+    predicate = query.compile(':archived,:archived and (:archived)')
+    assert isinstance(predicate.root, query.Mask)
+    assert predicate.bitmap_only
+    assert predicate.on_bitmap(filters.TAGS_BITS[':archived'])
+
+
+@pytest.mark.parametrize('query_', [
+    'bad:tag', '(site/', ':archived and', '"site/'])
+def test_compile_invalid(query_):
+    with pytest.raises(errors.Error):
+        query.compile(query_)
+
+
+@pytest.mark.parametrize('query_, found', [
+    ('My Project', {'My Project'}),
+    ('  My   Project ', {'My Project'}),
+    ('"My Project"', {'My Project'}),
+    ("'My Project' or 'and'", {'My Project', 'and', 'Sand box'}),
+    ('and', {'and', 'Sand box'}),
+    ('not', {'not'}),
+    ('"and" and not box', {'and'}),
+    ('"or"', set()),
+])
+def test_compile_names(query_, found):
+    names = ['My Project', 'and', 'Sand box', 'not']
+    predicate = query.compile(query_)
+    assert {name for name in names if predicate({'name': name})} == found
@@ -0,0 +1,58 @@
+import datetime
+import time
+
+import pytest
+import requests
+
+from repin import scheduler
+
+
+def response(status=200, latency=0.05, **headers):
+    result = requests.models.Response()
+    result.status_code = status
+    result.elapsed = datetime.timedelta(seconds=latency)
+    result.headers = requests.structures.CaseInsensitiveDict({
+        key.replace('_', '-'): value for key, value in headers.items()})
+    return result
+
+
+@pytest.fixture
+def limiter(gitlab, monkeypatch):
+    monkeypatch.setattr(scheduler, 'DECREASE_INTERVAL', 0)
+    return scheduler.Scheduler()
+
+
+def test_aimd(limiter):
+    limiter.observe(response())
+    start = limiter.limit
+    for _ in range(20):
+        limiter.observe(response())
+    assert start < limiter.limit < start + 4
+
+    increased = limiter.limit
+    limiter.observe(response(latency=2))
+    assert limiter.limit == pytest.approx(increased * 0.9)
+
+    throttled = response(429)
+    limiter.observe(throttled)
+    assert limiter.limit == pytest.approx(increased * 0.45)
+    # python-gitlab needs it to repeat request
+    assert throttled.headers['Retry-After'] == '2'
+    assert limiter.paused_until > time.time() + 1
+
+
+def test_retry_after(limiter):
+    limiter.observe(response(503, Retry_After='7'))
+    assert 6 < limiter.paused_until - time.time() <= 7
+
+    reset = int(time.time()) + 30
+    limiter.active = 1
+    limiter.observe(response(RateLimit_Remaining='1', RateLimit_Reset=str(
+        reset)))
+    assert limiter.paused_until == pytest.approx(reset)
+
+
+def test_backoff():
+    assert 1 <= scheduler.backoff(1) <= 3
+    assert 8 <= scheduler.backoff(4) <= 24
+    assert scheduler.backoff(10) <= scheduler.RETRY_BACKOFF_MAX * 1.5
@@ -0,0 +1,132 @@
+import pytest
+
+from repin import setup_parser
+
+FILES = {
+    'requirements.txt': 'requests>=2\n# comment\ntoml\n',
+    'README.md': '# pkg\n',
+    'pkg/__init__.py': '"""Package."""\n__version__ = "1.2.3"\n',
+    'pkg/version.py': 'VERSION = (2, 0)\n',
+}
+
+
+def extract(source):
+    return setup_parser.extract(source, FILES.get)
+
+
+def test_literals():
+    assert extract('''
+from setuptools import setup, find_packages
+
+setup(
+    name='pkg',
+    version='1.0',
+    packages=find_packages(),
+    install_requires=['requests'],
+    extras_require={'dev': ['pytest']},
+)
+''') == {
+        'name': 'pkg',
+        'version': '1.0',
+        'install_requires': ['requests'],
+        'extras_require': {'dev': ['pytest']},
+    }
+
+
+def test_files_and_imports():
+    result = extract('''
+import os
+import re
+import setuptools
+from pkg import __version__
+from pkg.version import VERSION
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+
+def read(name):
+    with open(os.path.join(here, name)) as f:
+        return f.read()
+
+
+requirements = [
+    line.strip() for line in read('requirements.txt').splitlines()
+    if line and not line.startswith('#')
+]
+init = read('pkg/__init__.py')
+
+setuptools.setup(
+    name='pkg',
+    version=__version__,
+    description=read('README.md').splitlines()[0].lstrip('# '),
+    install_requires=requirements,
+    **{'extras_require': {'v': ['x==%d.%d' % VERSION]}}
+)
+''')
+    assert result == {
+        'name': 'pkg',
+        'version': '1.2.3',
+        'description': 'pkg',
+        'install_requires': ['requests>=2', 'toml'],
+        'extras_require': {'v': ['x==2.0']},
+    }
+
+
+def test_unresolved_optional_argument_is_dropped():
+    assert extract('''
+from setuptools import setup
+from pkg.commands import Command
+
+setup(name='pkg', cmdclass={'test': Command})
+''') == {'name': 'pkg'}
+
+
+@pytest.mark.parametrize('source', [
+    'from setuptools import setup\nsetup(name=get_name())\n',
+    'from setuptools import setup\nimport sys\n'
+    'if sys.version_info > (3,):\n    setup(name="pkg")\n',
+    'from setuptools import setup\n'
+    'setup(name="pkg", version=open("VERSION").read())\n',
+    'from setuptools import setup\n'
+    'def main():\n    setup(name="pkg")\nmain()\n',
+    'print("no setup")\n',
+    'setup(\n',
+    'from setuptools import setup\nimport re\n'
+    'setup(name=re.sub("a", "b", "a"))\n',
+    'from setuptools import setup\nsetup(name=open)\n',
+    'from setuptools import setup\n'
+    'setup(name="{:>999999999}".format("pkg"))\n',
+    'from setuptools import setup\nsetup(name="%999999999s" % "pkg")\n',
+    'from setuptools import setup\nsetup(name=("x" * 1000) * 1000000)\n',
+    'from setuptools import setup\n'
+    'setup(name="pkg".replace("", "x" * 1000000))\n',
+    'from setuptools import setup\n'
+    'setup(name="".join(["x" * 1000000 for c in "pkg"]))\n',
+])
+def test_unresolved(source):
+    assert extract(source) is None
+
+
+@pytest.mark.parametrize('names', [
+    setup_parser.STDLIB_MODULES,
+    # python before 3.10
+    frozenset(),
+])
+def test_stdlib_imports_are_not_looked_up(names, monkeypatch):
+    monkeypatch.setattr(setup_parser, 'STDLIB_MODULES', names)
+    paths = []
+
+    def read(path):
+        paths.append(path)
+        return FILES.get(path)
+
+    assert setup_parser.extract('''
+import sys
+import json.decoder
+from setuptools import setup
+from distutils.util import strtobool
+from email import utils
+
+setup(name='pkg', description=sys.argv[0])
+''', read) == {'name': 'pkg'}
+    assert paths == []